@@ -1,40 +1,334 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+import atexit
+import contextlib
+import io
+import json
 import os
+import queue
+import shutil
+import threading
+import time
+import tracemalloc
+
+import main as m
+import sketches
 
 # Define the CSV file path
 DATA_FILE = "dados.csv"
 
+# Records older than RETENTION_DAYS are moved to compressed monthly files in ARCHIVE_DIR
+ARCHIVE_DIR = "arquivo"
+ARCHIVE_MANIFEST = os.path.join(ARCHIVE_DIR, "manifest.json")
+RETENTION_DAYS = 120
+
+# Optional month-partitioned layout (DADOS_PARTICIONADOS=1): one CSV per month in
+# PARTITION_DIR plus a manifest of row counts, min/max timestamps and IDs. Once
+# converted, the manifest keeps every process on it, with or without the variable.
+PARTITION_DIR = "dados"
+PARTITION_MANIFEST = os.path.join(PARTITION_DIR, "manifest.json")
+PARTITIONED = os.environ.get("DADOS_PARTICIONADOS") == "1"
+
+# Layout of DATA_FILE. Bump SCHEMA_VERSION and register a migration in _MIGRATIONS when it changes
+SCHEMA_VERSION = 2
+BASE_COLUMNS = [
+    'id', 'data_adicionada', 'precoInicio', 'precoFinal',
+    'quantidadeInicio', 'quantidadeFinal', 'elasticidade'
+]
+# Profit figures derived from fields that never change after a record is written
+DERIVED_COLUMNS = ['lucro_unitario', 'lucro_total', 'margem_percentual']
+COLUMNS = BASE_COLUMNS + DERIVED_COLUMNS
+
+# Columns summarized by the streaming sketches, with the bin edges of each
+SKETCH_EDGES = {
+    'elasticidade': sketches.ELASTICITY_EDGES,
+    'precoFinal': sketches.PRICE_EDGES,
+}
+
+# Serializes every read-modify-write of DATA_FILE (direct calls and the background writer)
+_file_lock = threading.RLock()
+
+# Held by jobs that move records between files (archiving, conversion) and by
+# rebuild_sketches, whose scan runs outside _file_lock
+_maintenance_lock = threading.RLock()
+
+# Sketch deltas committed while rebuild_sketches scans (None while no rebuild runs)
+_sketch_rebuild_log = None
+
+# Background group-commit writer (None while inactive)
+_writer = None
+_writer_lock = threading.Lock()
+
 def get_current_date():
     """Return current date and time formatted as string"""
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 def create_database():
     """Create the CSV database file if it doesn't exist"""
+    if _partitioned():
+        return _create_partitioned_database()
+
     if not os.path.exists(DATA_FILE):
         # Create empty DataFrame with the required columns
-        df = pd.DataFrame(columns=[
-            'id', 'data_adicionada', 'precoInicio', 'precoFinal', 
-            'quantidadeInicio', 'quantidadeFinal', 'elasticidade'
-        ])
+        df = pd.DataFrame(columns=COLUMNS)
         # Save empty DataFrame to CSV
         df.to_csv(DATA_FILE, index=False)
+        _save_schema_version(SCHEMA_VERSION)
+        _init_sketches()
         print(f"✅ Database file '{DATA_FILE}' created successfully")
     return True
 
-def insert_data(data_adicionada, precoInicio, precoFinal, quantidadeInicio, quantidadeFinal, elasticidade=None):
-    """Insert new data into the CSV database"""
-    # Read existing data
-    if os.path.exists(DATA_FILE):
-        df = pd.read_csv(DATA_FILE)
-    else:
-        # Create database if it doesn't exist
+def _read_data():
+    """Read the whole CSV database, creating it first if needed"""
+    if not os.path.exists(DATA_FILE):
         create_database()
-        df = pd.read_csv(DATA_FILE)
-    
+    return pd.read_csv(DATA_FILE)
+
+def _write_data(df):
+    """Atomically replace the CSV database with the given DataFrame"""
+    # Write to a temporary file and rename it so a crash never leaves a half-written file
+    tmp_file = f"{DATA_FILE}.tmp"
+    df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, DATA_FILE)
+
+def _read_files(paths):
+    """Read and concatenate data files, in parallel when there are several"""
+    if not paths:
+        return pd.DataFrame(columns=COLUMNS)
+    if len(paths) == 1:
+        return pd.read_csv(paths[0])
+
+    with ThreadPoolExecutor(max_workers=min(len(paths), 4)) as pool:
+        frames = list(pool.map(pd.read_csv, paths))
+    return pd.concat(frames, ignore_index=True)
+
+def _partitioned():
+    """Return True when the data lives in month partitions (requested or already converted)"""
+    return PARTITIONED or os.path.exists(PARTITION_MANIFEST)
+
+def _hot_files(cutoff_date=None):
+    """
+    List the non-archived data files that may hold records on or after cutoff_date
+
+    Args:
+        cutoff_date (datetime, optional): Start of the period. None lists every file.
+
+    Returns:
+        list: DATA_FILE, or the overlapping month partitions in the partitioned layout
+    """
+    if _partitioned():
+        return _partition_files(cutoff_date)
+    return [DATA_FILE] if os.path.exists(DATA_FILE) else []
+
+def _load_partition_manifest():
+    """Return {'max_id', 'partitions': {month: {'rows', 'min', 'max', 'max_id'}}}"""
+    if not os.path.exists(PARTITION_MANIFEST):
+        return {'max_id': 0, 'partitions': {}}
+    with open(PARTITION_MANIFEST, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_partition_manifest(manifest):
+    """Atomically write the partition manifest"""
+    tmp_file = f"{PARTITION_MANIFEST}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, PARTITION_MANIFEST)
+
+def _partition_path(mes):
+    """Return the partition file for a 'YYYY-MM' month"""
+    return os.path.join(PARTITION_DIR, f"{mes}.csv")
+
+def _partition_files(cutoff_date=None):
+    """Return the month partitions that may hold records on or after cutoff_date, oldest first"""
+    partitions = _load_partition_manifest()['partitions']
+    return [
+        _partition_path(mes) for mes, info in sorted(partitions.items())
+        if cutoff_date is None or pd.Timestamp(info['max']) >= cutoff_date
+    ]
+
+def _latest_partition(manifest):
+    """Return the month holding the latest record (None if there are no records)"""
+    partitions = manifest['partitions']
+    if not partitions:
+        return None
+    return max(partitions, key=lambda mes: (pd.Timestamp(partitions[mes]['max']), partitions[mes]['max_id']))
+
+def _update_partition_stats(manifest, mes, part):
+    """Merge the stats of rows appended to a partition into the manifest"""
+    datas = pd.to_datetime(part['data_adicionada'])
+    info = manifest['partitions'].get(mes)
+    novo = {
+        'rows': len(part),
+        'min': str(datas.min()),
+        'max': str(datas.max()),
+        'max_id': int(part['id'].max())
+    }
+    if info is not None:
+        novo = {
+            'rows': info['rows'] + novo['rows'],
+            'min': str(min(pd.Timestamp(info['min']), datas.min())),
+            'max': str(max(pd.Timestamp(info['max']), datas.max())),
+            'max_id': max(info['max_id'], novo['max_id'])
+        }
+    manifest['partitions'][mes] = novo
+    manifest['max_id'] = max(manifest['max_id'], novo['max_id'])
+
+def _append_csv(path, df):
+    """Append rows to a CSV file, first cutting off a line left half-written by a crash"""
+    if os.path.exists(path):
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    f.seek(max(0, size - 65536))
+                    tail = f.read()
+                    f.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+    header = not os.path.exists(path) or os.path.getsize(path) == 0
+    df.to_csv(path, mode='a', index=False, header=header)
+
+def _append_to_partitions(manifest, df):
+    """
+    Append records to their month partitions and save the updated manifest
+
+    The manifest is saved first: after a crash in between it may count rows
+    that were never written, but its max_id never falls behind the IDs in the
+    partitions, so no ID is handed out twice.
+    """
+    meses = pd.to_datetime(df['data_adicionada']).dt.strftime('%Y-%m')
+    partes = list(df.groupby(meses))
+    for mes, part in partes:
+        _update_partition_stats(manifest, mes, part)
+    _save_partition_manifest(manifest)
+
+    for mes, part in partes:
+        _append_csv(_partition_path(mes), part)
+
+def convert_to_partitioned():
+    """
+    Split DATA_FILE into month partitions in PARTITION_DIR
+
+    DATA_FILE is then renamed to '<DATA_FILE>.convertido', so nothing keeps
+    reading or writing the copy the partitions replaced.
+
+    Returns:
+        int: Number of records converted
+    """
+    with _maintenance_lock, _file_lock:
+        os.makedirs(PARTITION_DIR, exist_ok=True)
+        manifest = {'max_id': 0, 'partitions': {}}
+        rows = 0
+        if os.path.exists(DATA_FILE):
+            df = pd.read_csv(DATA_FILE)
+            rows = len(df)
+            if rows:
+                _append_to_partitions(manifest, df.reindex(columns=COLUMNS))
+        if not rows:
+            _save_partition_manifest(manifest)
+        if os.path.exists(DATA_FILE):
+            os.replace(DATA_FILE, f"{DATA_FILE}.convertido")
+    return rows
+
+def _create_partitioned_database():
+    """Create PARTITION_DIR, converting an existing DATA_FILE on first use"""
+    if not os.path.exists(PARTITION_MANIFEST):
+        rows = convert_to_partitioned()
+        if not os.path.exists(_schema_file()):
+            _save_schema_version(SCHEMA_VERSION if rows == 0 else 1)
+        if rows == 0 and not has_sketches():
+            _init_sketches()
+        print(f"✅ Partitioned database '{PARTITION_DIR}' created successfully")
+    return True
+
+def compute_derived_columns(df):
+    """
+    Compute the profit columns of each record from its prices and quantity
+
+    Args:
+        df (pandas.DataFrame): Records with precoInicio, precoFinal and quantidadeFinal
+
+    Returns:
+        pandas.DataFrame: The same DataFrame with DERIVED_COLUMNS filled in
+    """
+    preco_inicio = pd.to_numeric(df['precoInicio'], errors='coerce')
+    preco_final = pd.to_numeric(df['precoFinal'], errors='coerce')
+    quantidade_final = pd.to_numeric(df['quantidadeFinal'], errors='coerce')
+
+    df['lucro_unitario'] = preco_final - preco_inicio
+    df['lucro_total'] = df['lucro_unitario'] * quantidade_final
+    df['margem_percentual'] = (df['lucro_unitario'] / preco_final) * 100
+    return df
+
+def _schema_file():
+    """Return the sidecar file holding the schema version of DATA_FILE"""
+    return f"{os.path.splitext(DATA_FILE)[0]}.schema.json"
+
+def _load_schema_version():
+    """
+    Return the schema version of the data files
+
+    The header is authoritative for v1: files missing any of DERIVED_COLUMNS
+    predate versioning, whatever the sidecar says. Otherwise the sidecar
+    holds the version, and files without one are current.
+    """
+    files = _hot_files() + _archive_partitions()
+    if not files:
+        return SCHEMA_VERSION
+    header = pd.read_csv(files[0], nrows=0).columns
+    if any(column not in header for column in DERIVED_COLUMNS):
+        return 1
+    if not os.path.exists(_schema_file()):
+        return SCHEMA_VERSION
+    with open(_schema_file(), encoding='utf-8') as f:
+        return json.load(f)['version']
+
+def _save_schema_version(version):
+    """Record the schema version of the data files"""
+    with open(_schema_file(), 'w', encoding='utf-8') as f:
+        json.dump({'version': version}, f)
+
+def _migration_v2(df):
+    """v2: store lucro_unitario, lucro_total and margem_percentual with each record"""
+    return compute_derived_columns(df)
+
+_MIGRATIONS = {
+    2: _migration_v2,
+}
+
+def migrate_database():
+    """
+    Bring DATA_FILE and the archive up to SCHEMA_VERSION
+
+    Each pending migration is applied to whole files at once, so backfilling
+    a large history is a single vectorized pass per file.
+
+    Returns:
+        bool: True if a migration was applied
+    """
+    with _file_lock:
+        version = _load_schema_version()
+        if version >= SCHEMA_VERSION:
+            return False
+
+        for path in _hot_files() + _archive_partitions():
+            df = pd.read_csv(path)
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                df = _MIGRATIONS[target](df)
+
+            tmp_file = f"{path}.tmp"
+            df.to_csv(tmp_file, index=False, compression='gzip' if path.endswith('.gz') else None)
+            os.replace(tmp_file, path)
+
+        _save_schema_version(SCHEMA_VERSION)
+    return True
+
+def _append_row(df, data_adicionada, precoInicio, precoFinal, quantidadeInicio, quantidadeFinal, elasticidade=None):
+    """Append a new record to the DataFrame and return (df, new_id)"""
     # Generate a new ID (max existing ID + 1, or 1 if no records exist)
-    new_id = 1 if df.empty else df['id'].max() + 1
-    
+    new_id = 1 if df.empty else int(df['id'].max()) + 1
+
     # Create new row as a dictionary
     new_row = {
         'id': new_id,
@@ -45,26 +339,270 @@ def insert_data(data_adicionada, precoInicio, precoFinal, quantidadeInicio, quan
         'quantidadeFinal': quantidadeFinal,
         'elasticidade': elasticidade
     }
-    
+    new_df = compute_derived_columns(pd.DataFrame([new_row]))
+
     # Append new row to DataFrame
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    
-    # Save updated DataFrame to CSV
-    df.to_csv(DATA_FILE, index=False)
-    return new_id
+    if df.empty:
+        df = new_df.reindex(columns=COLUMNS)
+    else:
+        df = pd.concat([df, new_df], ignore_index=True)
+    return df, new_id
 
-def get_latest_data():
-    """Fetch the latest data record from the CSV database"""
-    if not os.path.exists(DATA_FILE):
+def latest_index(df):
+    """
+    Return the index label of the latest record of a non-empty DataFrame
+
+    The latest record is the one with the most recent data_adicionada, ties
+    broken by the highest ID. IDs alone don't tell: imported history gets IDs
+    above the records that were already stored.
+    """
+    datas = pd.to_datetime(df['data_adicionada']).to_numpy()
+    return df.index[np.lexsort((df['id'].to_numpy(), datas))[-1]]
+
+def _set_latest_elasticity(df, elasticidade):
+    """Set the elasticity of the latest record in place. Returns False if df is empty"""
+    if df.empty:
+        return False
+
+    df.at[latest_index(df), 'elasticidade'] = elasticidade
+    return True
+
+def _apply_batch(batch):
+    """
+    Apply a list of (op, kwargs) operations with one write per touched file
+
+    Returns:
+        list: New ID for each 'insert', success flag for each 'update_elasticity'
+    """
+    with _file_lock:
+        if _partitioned():
+            return _apply_partitioned_batch(batch)
+
+        df = _read_data()
+        results, sketch_changes = [], []
+        for op, kwargs in batch:
+            if op == 'insert':
+                df, new_id = _append_row(df, **kwargs)
+                results.append(new_id)
+                sketch_changes += _record_sketch_changes(kwargs)
+            else:
+                sketch_changes += _elasticity_sketch_changes(df, kwargs['elasticidade'])
+                results.append(_set_latest_elasticity(df, **kwargs))
+        _write_data(df)
+        _update_sketches(sketch_changes)
+        return results
+
+def _apply_partitioned_batch(batch):
+    """Append a batch to the month partitions, rewriting only the latest one on updates"""
+    manifest = _load_partition_manifest()
+    next_id = manifest['max_id'] + 1
+    rows, results = [], []
+    update_latest, elasticidade_latest = False, None
+
+    for op, kwargs in batch:
+        if op == 'insert':
+            rows.append({'id': next_id, **kwargs})
+            results.append(next_id)
+            next_id += 1
+        elif rows:
+            # The latest record is still in this batch
+            rows[-1]['elasticidade'] = kwargs['elasticidade']
+            results.append(True)
+        else:
+            update_latest, elasticidade_latest = True, kwargs['elasticidade']
+            results.append(manifest['max_id'] > 0)
+
+    sketch_changes = []
+    mes = _latest_partition(manifest)
+    if update_latest and mes is not None:
+        path = _partition_path(mes)
+        df = pd.read_csv(path)
+        sketch_changes += _elasticity_sketch_changes(df, elasticidade_latest)
+        _set_latest_elasticity(df, elasticidade_latest)
+        tmp_file = f"{path}.tmp"
+        df.to_csv(tmp_file, index=False)
+        os.replace(tmp_file, path)
+
+    if rows:
+        novos = compute_derived_columns(pd.DataFrame(rows)).reindex(columns=COLUMNS)
+        _append_to_partitions(manifest, novos)
+        for row in rows:
+            sketch_changes += _record_sketch_changes(row)
+    _update_sketches(sketch_changes)
+    return results
+
+class _GroupCommitWriter:
+    """
+    Background thread that coalesces queued writes into a single commit
+
+    A request that finds the writer idle is committed at once; requests that
+    queue up while a commit is on disk go together in the next one, so the
+    data file is written once per batch without delaying a lone write.
+    A positive `window` additionally waits that many seconds for more
+    requests before each commit. Each caller receives a Future resolved
+    after its batch is on disk.
+    """
+
+    def __init__(self, window=0.0, max_batch=500):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, kwargs):
+        """Queue an operation ('insert' or 'update_elasticity') and return its Future"""
+        future = Future()
+        self._queue.put((op, kwargs, future))
+        return future
+
+    def stop(self):
+        """Commit everything still queued and stop the thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect_batch(self, first):
+        """Gather the requests queued behind `first`, waiting up to the commit window"""
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop sentinel back so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch):
+        """Apply a batch of operations with a single read and a single write"""
+        try:
+            results = _apply_batch([(op, kwargs) for op, kwargs, _ in batch])
+        except Exception as exc:
+            for _, _, future in batch:
+                future.set_exception(exc)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._commit(self._collect_batch(item))
+
+def start_background_writer(window=0.0, max_batch=500):
+    """
+    Start the background group-commit writer (no-op if it is already running)
+
+    While active, insert_data and update_elasticity are routed through a queue and
+    every request queued while the previous commit was being written goes into
+    the next file write.
+
+    Args:
+        window (float): Extra seconds to wait for more requests before committing a batch
+        max_batch (int): Maximum number of requests committed together
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _GroupCommitWriter(window=window, max_batch=max_batch)
+    return True
+
+def stop_background_writer():
+    """Flush all pending writes to disk and stop the background writer"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+    return True
+
+# Never lose queued writes when the interpreter shuts down
+atexit.register(stop_background_writer)
+
+def insert_data_async(data_adicionada, precoInicio, precoFinal, quantidadeInicio, quantidadeFinal, elasticidade=None):
+    """
+    Queue a new record on the background writer
+
+    Returns:
+        concurrent.futures.Future: Resolves to the new record ID once committed.
+        If the writer is not running the insert happens immediately.
+    """
+    kwargs = dict(
+        data_adicionada=data_adicionada,
+        precoInicio=precoInicio,
+        precoFinal=precoFinal,
+        quantidadeInicio=quantidadeInicio,
+        quantidadeFinal=quantidadeFinal,
+        elasticidade=elasticidade
+    )
+    writer = _writer
+    if writer is not None:
+        return writer.submit('insert', kwargs)
+
+    future = Future()
+    future.set_result(insert_data(**kwargs))
+    return future
+
+def insert_data(data_adicionada, precoInicio, precoFinal, quantidadeInicio, quantidadeFinal, elasticidade=None):
+    """Insert new data into the CSV database"""
+    if _writer is not None:
+        # Wait for the background writer to commit the batch containing this row
+        return insert_data_async(data_adicionada, precoInicio, precoFinal,
+                                 quantidadeInicio, quantidadeFinal, elasticidade).result()
+
+    return _apply_batch([('insert', dict(
+        data_adicionada=data_adicionada,
+        precoInicio=precoInicio,
+        precoFinal=precoFinal,
+        quantidadeInicio=quantidadeInicio,
+        quantidadeFinal=quantidadeFinal,
+        elasticidade=elasticidade
+    ))])[0]
+
+def _latest_record():
+    """Return the latest record as a Series (None if there are no records)"""
+    if _partitioned():
+        # Only the partition holding the latest record needs to be read
+        mes = _latest_partition(_load_partition_manifest())
+        path = None if mes is None else _partition_path(mes)
+    else:
+        path = DATA_FILE
+    if path is None or not os.path.exists(path):
         return None
-    
-    df = pd.read_csv(DATA_FILE)
+
+    with _file_lock:
+        # Hot files are appended to in place, so they are only read between writes
+        df = pd.read_csv(path)
     if df.empty:
         return None
-    
-    # Get the row with the maximum ID
-    latest_row = df.loc[df['id'].idxmax()]
-    
+    return df.loc[latest_index(df)]
+
+def _max_id():
+    """Return the highest record ID (0 if there are no records)"""
+    if _partitioned():
+        return _load_partition_manifest()['max_id']
+    if not os.path.exists(DATA_FILE):
+        return 0
+    ids = pd.read_csv(DATA_FILE, usecols=['id'])['id']
+    return 0 if ids.empty else int(ids.max())
+
+def get_latest_data():
+    """Fetch the latest data record from the CSV database"""
+    latest_row = _latest_record()
+    if latest_row is None:
+        return None
+
     return (
         latest_row['precoInicio'],
         latest_row['precoFinal'],
@@ -75,48 +613,880 @@ def get_latest_data():
 
 def update_elasticity(elasticidade):
     """Update the elasticity value for the latest record"""
-    if not os.path.exists(DATA_FILE):
-        return False
-    
-    df = pd.read_csv(DATA_FILE)
-    if df.empty:
+    writer = _writer
+    if writer is not None:
+        return writer.submit('update_elasticity', dict(elasticidade=elasticidade)).result()
+
+    if not _partitioned() and not os.path.exists(DATA_FILE):
         return False
-    
-    # Find the index of the row with the maximum ID
-    max_id_idx = df['id'].idxmax()
-    
-    # Update the elasticity value
-    df.at[max_id_idx, 'elasticidade'] = elasticidade
-    
-    # Save updated DataFrame to CSV
-    df.to_csv(DATA_FILE, index=False)
-    return True
+
+    return _apply_batch([('update_elasticity', dict(elasticidade=elasticidade))])[0]
 
 def get_filtered_data(days=None):
     """
     Get data filtered by a specific time period
-    
+
     Args:
         days (int, optional): Number of days to filter by. None returns all data.
-    
+
     Returns:
         pandas.DataFrame: Filtered data
     """
-    if not os.path.exists(DATA_FILE):
+    if not _partitioned() and not os.path.exists(DATA_FILE):
         create_database()
         return pd.DataFrame()
-    
-    df = pd.read_csv(DATA_FILE)
-    
+
+    cutoff_date = None
+    if days is not None:
+        cutoff_date = datetime.now() - pd.Timedelta(days=days)
+
+    # Only files overlapping the period are opened: archived months, and in the
+    # partitioned layout only the month partitions the period reaches
+    arquivados = _archive_partitions(cutoff_date)
+    frames = [_read_files(arquivados)] if arquivados else []
+    with _file_lock:
+        # Hot files are appended to in place, so they are only read between writes
+        frames.append(_read_files(_hot_files(cutoff_date)))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
     if df.empty:
         return df
-    
+
     # Convert 'data_adicionada' to datetime
     df['data_adicionada'] = pd.to_datetime(df['data_adicionada'])
-    
-    if days is not None:
+
+    if cutoff_date is not None:
         # Filter by date range
-        cutoff_date = datetime.now() - pd.Timedelta(days=days)
         df = df[df['data_adicionada'] >= cutoff_date]
-    
-    return df
\ No newline at end of file
+
+    return df
+
+def data_stamp():
+    """
+    Return a value that changes whenever the stored records change
+
+    Built from the modification time and size of the hot files and the
+    manifests, so callers can key caches of derived results on it without
+    reading any records.
+    """
+    stamp = []
+    for path in _hot_files() + [PARTITION_MANIFEST, ARCHIVE_MANIFEST]:
+        if os.path.exists(path):
+            info = os.stat(path)
+            stamp.append((path, info.st_mtime_ns, info.st_size))
+    return tuple(stamp)
+
+def get_hot_data():
+    """
+    Get every record not yet archived
+
+    The hot file (or the month partitions) holds the retention window plus
+    the latest record, so this read stays bounded however long the history.
+
+    Returns:
+        pandas.DataFrame: Hot records
+    """
+    with _file_lock:
+        df = _read_files(_hot_files())
+    if not df.empty:
+        df['data_adicionada'] = pd.to_datetime(df['data_adicionada'])
+    return df
+
+def _load_archive_manifest():
+    """Return {month: {'rows', 'min', 'max'}} for every archive partition"""
+    if not os.path.exists(ARCHIVE_MANIFEST):
+        return {}
+    with open(ARCHIVE_MANIFEST, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_archive_manifest(manifest):
+    """Atomically write the archive manifest"""
+    tmp_file = f"{ARCHIVE_MANIFEST}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, ARCHIVE_MANIFEST)
+
+def _archive_path(mes):
+    """Return the archive file for a 'YYYY-MM' month"""
+    return os.path.join(ARCHIVE_DIR, f"{mes}.csv.gz")
+
+def _archive_partitions(cutoff_date=None):
+    """
+    List the archive files that may hold records on or after cutoff_date
+
+    Args:
+        cutoff_date (datetime, optional): Start of the period. None lists every partition.
+
+    Returns:
+        list: Archive file paths, oldest month first
+    """
+    return [_archive_path(mes) for mes in archived_months(cutoff_date)]
+
+def archived_months(cutoff_date=None):
+    """List the archived 'YYYY-MM' months that may hold records on or after cutoff_date, oldest first"""
+    manifest = _load_archive_manifest()
+    return [
+        mes for mes, info in sorted(manifest.items())
+        if cutoff_date is None or pd.Timestamp(info['max']) >= cutoff_date
+    ]
+
+def get_archived_month(mes):
+    """Get the archived records of a 'YYYY-MM' month"""
+    df = pd.read_csv(_archive_path(mes))
+    df['data_adicionada'] = pd.to_datetime(df['data_adicionada'])
+    return df
+
+def archive_old_data(retention_days=RETENTION_DAYS):
+    """
+    Move records older than the retention horizon to the compressed archive
+
+    Old records are appended to one gzip CSV per month in ARCHIVE_DIR and the
+    hot file is rewritten with only the recent ones. The latest record and the
+    one with the highest ID always stay in the hot file so get_latest_data and
+    new IDs keep working. In the partitioned layout whole month partitions
+    older than the horizon are moved.
+
+    Args:
+        retention_days (int): Number of days kept in the hot file
+
+    Returns:
+        int: Number of records archived
+    """
+    cutoff_date = datetime.now() - pd.Timedelta(days=retention_days)
+    with _maintenance_lock, _file_lock:
+        if _partitioned():
+            return _archive_old_partitions(cutoff_date)
+
+        if not os.path.exists(DATA_FILE):
+            return 0
+
+        df = pd.read_csv(DATA_FILE)
+        if df.empty:
+            return 0
+
+        datas = pd.to_datetime(df['data_adicionada'])
+        manter = (df.index == latest_index(df)) | (df['id'] == df['id'].max())
+        antigos = (datas < cutoff_date) & ~manter
+        if not antigos.any():
+            return 0
+
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        manifest = _load_archive_manifest()
+
+        meses = datas[antigos].dt.strftime('%Y-%m')
+        for mes, part in df[antigos].groupby(meses):
+            _archive_month(manifest, mes, part)
+
+        _save_archive_manifest(manifest)
+
+        # Compact the hot file down to the retention window
+        _write_data(df[~antigos])
+        return int(antigos.sum())
+
+def _archive_month(manifest, mes, part):
+    """Merge records into the archive file of a month and update the archive manifest"""
+    path = _archive_path(mes)
+    if os.path.exists(path):
+        # Dropping duplicate IDs makes a retry after an interrupted run harmless
+        part = pd.concat([pd.read_csv(path), part], ignore_index=True)
+        part = part.drop_duplicates(subset='id', keep='last')
+
+    tmp_file = f"{path}.tmp"
+    part.to_csv(tmp_file, index=False, compression='gzip')
+    os.replace(tmp_file, path)
+
+    datas_part = pd.to_datetime(part['data_adicionada'])
+    manifest[mes] = {
+        'rows': len(part),
+        'min': str(datas_part.min()),
+        'max': str(datas_part.max())
+    }
+
+def _archive_old_partitions(cutoff_date):
+    """Move month partitions entirely older than cutoff_date to the archive"""
+    manifest = _load_partition_manifest()
+    latest = _latest_partition(manifest)
+    antigos = [
+        mes for mes, info in sorted(manifest['partitions'].items())
+        if pd.Timestamp(info['max']) < cutoff_date and mes != latest
+    ]
+    if not antigos:
+        return 0
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archive_manifest = _load_archive_manifest()
+    rows = 0
+    for mes in antigos:
+        part = pd.read_csv(_partition_path(mes))
+        _archive_month(archive_manifest, mes, part)
+        rows += len(part)
+    _save_archive_manifest(archive_manifest)
+
+    # Drop the partitions only once the archive manifest points at their records
+    for mes in antigos:
+        del manifest['partitions'][mes]
+    _save_partition_manifest(manifest)
+    for mes in antigos:
+        os.remove(_partition_path(mes))
+    return rows
+
+
+# Rows read from the CSV per chunk when streaming large histories
+EXPORT_CHUNKSIZE = 50_000
+
+# Excel caps a worksheet at 1,048,576 rows (one is used by the header)
+EXCEL_MAX_ROWS = 1_048_575
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'parquet')
+
+def _coerce_chunk(chunk):
+    """Give a raw CSV chunk stable dtypes so every chunk of an export matches"""
+    chunk['data_adicionada'] = pd.to_datetime(chunk['data_adicionada'])
+    for col in chunk.columns:
+        if col == 'id':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('int64')
+        elif col != 'data_adicionada':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    return chunk
+
+class _CappedReader(io.RawIOBase):
+    """Raw reader that stops at the size its file had when it was opened"""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._f.readinto(memoryview(b)[:min(len(b), self._remaining)])
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+def _open_snapshot(paths):
+    """Open data files, each capped at its current size; call under _file_lock"""
+    files = []
+    try:
+        for path in paths:
+            f = open(path, 'rb')
+            files.append((path, io.BufferedReader(_CappedReader(f, os.fstat(f.fileno()).st_size))))
+    except BaseException:
+        for _, f in files:
+            f.close()
+        raise
+    return files
+
+def iter_filtered_data(days=None, chunksize=EXPORT_CHUNKSIZE):
+    """
+    Stream the data for a time period in chunks instead of loading it all at once
+
+    Every file is opened under _file_lock and read only up to the size it
+    had then, so the stream is a consistent snapshot: rows appended or
+    archived while it is consumed are neither read half-written nor missed.
+
+    Args:
+        days (int, optional): Number of days to filter by. None returns all data.
+        chunksize (int): Number of rows read per chunk
+
+    Yields:
+        pandas.DataFrame: Filtered chunk (may be empty)
+    """
+    if not os.path.exists(DATA_FILE):
+        create_database()
+
+    cutoff_date = None
+    if days is not None:
+        cutoff_date = datetime.now() - pd.Timedelta(days=days)
+
+    with _file_lock:
+        snapshot = _open_snapshot(_archive_partitions(cutoff_date) + _hot_files(cutoff_date))
+    try:
+        for path, f in snapshot:
+            compression = 'gzip' if path.endswith('.gz') else None
+            for chunk in pd.read_csv(f, chunksize=chunksize, compression=compression):
+                chunk = _coerce_chunk(chunk)
+                if cutoff_date is not None:
+                    chunk = chunk[chunk['data_adicionada'] >= cutoff_date]
+                yield chunk
+    finally:
+        for _, f in snapshot:
+            f.close()
+
+def _export_columns():
+    """Return the column names of the CSV database"""
+    if _partitioned():
+        return COLUMNS
+    if not os.path.exists(DATA_FILE):
+        create_database()
+    return list(pd.read_csv(DATA_FILE, nrows=0).columns)
+
+def _export_csv(chunks, destination):
+    """Append each chunk to a CSV file, writing the header once"""
+    rows = 0
+    header = True
+    if isinstance(destination, (str, os.PathLike)):
+        out_ctx = open(destination, 'w', newline='', encoding='utf-8')
+    else:
+        # Caller owns the buffer, don't close it
+        out_ctx = contextlib.nullcontext(destination)
+    with out_ctx as out:
+        for chunk in chunks:
+            chunk.to_csv(out, index=False, header=header)
+            header = False
+            rows += len(chunk)
+        if header:
+            # No rows matched: still write the header line
+            pd.DataFrame(columns=_export_columns()).to_csv(out, index=False)
+    return rows
+
+def _export_xlsx(chunks, destination):
+    """Stream chunks to an Excel workbook, starting a new sheet when one is full"""
+    from openpyxl import Workbook
+
+    columns = _export_columns()
+    # Write-only mode streams rows to disk instead of keeping every cell in memory
+    wb = Workbook(write_only=True)
+    ws = None
+    sheet_rows = EXCEL_MAX_ROWS
+    rows = 0
+    for chunk in chunks:
+        # Excel cells can't hold NaN
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for values in chunk.itertuples(index=False, name=None):
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                ws = wb.create_sheet(title=f"dados_{len(wb.worksheets) + 1}")
+                ws.append(columns)
+                sheet_rows = 0
+            ws.append(values)
+            sheet_rows += 1
+            rows += 1
+    if ws is None:
+        wb.create_sheet(title="dados_1").append(columns)
+    wb.save(destination)
+    return rows
+
+def _export_parquet(chunks, destination):
+    """Write each chunk as a Parquet row group"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Exportar para Parquet requer o pacote 'pyarrow' (pip install pyarrow)")
+
+    empty = _coerce_chunk(pd.DataFrame(columns=_export_columns()))
+    schema = pa.Schema.from_pandas(empty, preserve_index=False)
+    rows = 0
+    with pq.ParquetWriter(destination, schema) as writer:
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+def export_filtered_data(destination, formato='csv', days=None, chunksize=EXPORT_CHUNKSIZE):
+    """
+    Export the data for a time period to CSV, Excel or Parquet
+
+    The data is streamed in chunks so memory stays bounded by `chunksize`,
+    whatever the size of the history.
+
+    Args:
+        destination (str or file-like): Output path or binary/text buffer
+        formato (str): One of 'csv', 'xlsx' or 'parquet'
+        days (int, optional): Number of days to filter by. None exports all data.
+        chunksize (int): Number of rows processed at a time
+
+    Returns:
+        int: Number of rows exported
+    """
+    chunks = iter_filtered_data(days, chunksize=chunksize)
+    if formato == 'csv':
+        return _export_csv(chunks, destination)
+    elif formato == 'xlsx':
+        return _export_xlsx(chunks, destination)
+    elif formato == 'parquet':
+        return _export_parquet(chunks, destination)
+    raise ValueError(f"Formato de exportação inválido: {formato}. Use um de {EXPORT_FORMATS}")
+
+
+AGGREGATIONS = ('sum', 'mean', 'count', 'min', 'max')
+
+# group_by values accepted by aggregate_data and the pandas period each one maps to
+TIME_BUCKETS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+def _group_key(chunk, group_by, price_band, price_column):
+    """Return the group label of every row in a chunk"""
+    if group_by in TIME_BUCKETS:
+        return chunk['data_adicionada'].dt.to_period(TIME_BUCKETS[group_by]).dt.start_time
+    # Lower bound of the band the price falls in (e.g. 4.5 for 4.5 <= price < 5.0)
+    return (chunk[price_column] // price_band) * price_band
+
+def aggregate_data(group_by, metrics, days=None, price_band=0.5, price_column='precoFinal', chunksize=EXPORT_CHUNKSIZE):
+    """
+    Aggregate records by time bucket or price band without loading the whole history
+
+    Each chunk of the period is reduced to partial sums, counts, minimums and
+    maximums per group, and only those partials are combined, so the result
+    holds one row per group whatever the number of records.
+
+    Args:
+        group_by (str): 'day', 'week', 'month' or 'price_band'
+        metrics (dict): Aggregations per column, e.g. {'lucro_total': ['sum'], 'elasticidade': ['mean', 'count']}
+        days (int, optional): Number of days to filter by. None uses all data.
+        price_band (float): Width of each band (R$) when grouping by price
+        price_column (str): Price column used for the bands
+        chunksize (int): Number of rows processed at a time
+
+    Returns:
+        pandas.DataFrame: One row per group, indexed by the group label, with a
+        '<column>_<aggregation>' column per requested metric
+    """
+    if group_by not in TIME_BUCKETS and group_by != 'price_band':
+        raise ValueError(f"Agrupamento inválido: {group_by}. Use um de {list(TIME_BUCKETS) + ['price_band']}")
+    for col, aggs in metrics.items():
+        invalid = [agg for agg in aggs if agg not in AGGREGATIONS]
+        if invalid:
+            raise ValueError(f"Agregação inválida para '{col}': {invalid}. Use um de {AGGREGATIONS}")
+
+    columns = list(metrics)
+    partials = []
+    for chunk in iter_filtered_data(days, chunksize=chunksize):
+        if chunk.empty:
+            continue
+        key = _group_key(chunk, group_by, price_band, price_column).rename(group_by)
+        partials.append(chunk.groupby(key)[columns].agg(['sum', 'count', 'min', 'max']))
+
+    result_columns = [f"{col}_{agg}" for col, aggs in metrics.items() for agg in aggs]
+    if not partials:
+        # Keep the index type of a non-empty result so callers can format it the same way
+        if group_by in TIME_BUCKETS:
+            index = pd.DatetimeIndex([], name=group_by)
+        else:
+            index = pd.Index([], dtype='float64', name=group_by)
+        return pd.DataFrame({
+            col: pd.Series(dtype='int64' if col.endswith('_count') else 'float64') for col in result_columns
+        }, index=index)
+
+    # Combine the per-chunk partials of each group (partial sums and counts both add up)
+    combined = pd.concat(partials).groupby(level=0)
+    sums, mins, maxs = combined.sum(), combined.min(), combined.max()
+
+    result = pd.DataFrame(index=sums.index)
+    for col, aggs in metrics.items():
+        soma = sums[(col, 'sum')]
+        contagem = sums[(col, 'count')]
+        for agg in aggs:
+            if agg == 'sum':
+                result[f"{col}_sum"] = soma
+            elif agg == 'count':
+                result[f"{col}_count"] = contagem.astype('int64')
+            elif agg == 'mean':
+                result[f"{col}_mean"] = soma / contagem.where(contagem > 0)
+            elif agg == 'min':
+                result[f"{col}_min"] = mins[(col, 'min')]
+            else:
+                result[f"{col}_max"] = maxs[(col, 'max')]
+    return result.sort_index()
+
+
+def _sketch_dir():
+    """Return the directory holding the per-day sketches of DATA_FILE, one file per month"""
+    return f"{os.path.splitext(DATA_FILE)[0]}.sketches"
+
+def _sketch_path(mes, directory=None):
+    """Return the sketch file of a 'YYYY-MM' month"""
+    return os.path.join(directory or _sketch_dir(), f"{mes}.json")
+
+def has_sketches():
+    """Return True once the sketches of the stored history have been built"""
+    return os.path.isdir(_sketch_dir())
+
+def _init_sketches():
+    """Start the (empty) sketches of a new database"""
+    os.makedirs(_sketch_dir(), exist_ok=True)
+
+def _load_sketch_month(mes):
+    """Return {column: {day: {bin index: count}}} for one month ({} if it has no records)"""
+    path = _sketch_path(mes)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_sketch_month(mes, stored, directory=None):
+    """Atomically write the per-day sketches of one month"""
+    path = _sketch_path(mes, directory)
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        # json.dumps uses the C encoder, json.dump to a file doesn't
+        f.write(json.dumps(stored, sort_keys=True))
+    os.replace(tmp_file, path)
+
+def _sketch_months(primeiro_dia=None):
+    """List the months with stored sketches, starting at the month of primeiro_dia"""
+    meses = sorted(nome[:-len('.json')] for nome in os.listdir(_sketch_dir()) if nome.endswith('.json'))
+    return [mes for mes in meses if primeiro_dia is None or mes >= primeiro_dia[:7]]
+
+def _sketch_day(data_adicionada):
+    """Return the 'YYYY-MM-DD' time bucket of a record"""
+    return str(pd.Timestamp(data_adicionada).date())
+
+def _record_sketch_changes(record):
+    """Return the (column, day, value, weight) sketch changes for a new record"""
+    dia = _sketch_day(record['data_adicionada'])
+    return [
+        (col, dia, record[col], 1) for col in SKETCH_EDGES
+        if record.get(col) is not None and not pd.isna(record[col])
+    ]
+
+def _elasticity_sketch_changes(df, elasticidade):
+    """Return the sketch changes for replacing the elasticity of the latest record"""
+    if df.empty:
+        return []
+    latest_row = df.loc[latest_index(df)]
+    dia = _sketch_day(latest_row['data_adicionada'])
+    changes = []
+    if not pd.isna(latest_row['elasticidade']):
+        changes.append(('elasticidade', dia, latest_row['elasticidade'], -1))
+    if elasticidade is not None and not pd.isna(elasticidade):
+        changes.append(('elasticidade', dia, elasticidade, 1))
+    return changes
+
+def _tracking_sketches():
+    """Return True if committed records must be counted into the sketches"""
+    return has_sketches() or _sketch_rebuild_log is not None
+
+def _add_month_counts(stored, novos):
+    """Add {column: {day: {bin index: count}}} counts of one month into `stored`"""
+    for col, dias in novos.items():
+        for dia, contagens in dias.items():
+            buckets = stored.setdefault(col, {}).setdefault(dia, {})
+            for idx, count in contagens.items():
+                buckets[idx] = buckets.get(idx, 0) + count
+                if buckets[idx] == 0:
+                    del buckets[idx]
+
+def _merge_sketch_counts(por_mes):
+    """
+    Add {month: {column: {day: {bin index: count}}}} to the stored month files
+
+    Called under _file_lock. While rebuild_sketches runs the counts are also
+    logged so the rebuilt sketches include them.
+    """
+    if _sketch_rebuild_log is not None:
+        _sketch_rebuild_log.append(por_mes)
+    if not has_sketches():
+        return
+    for mes, novos in por_mes.items():
+        stored = _load_sketch_month(mes)
+        _add_month_counts(stored, novos)
+        _save_sketch_month(mes, stored)
+
+def _changes_to_counts(changes):
+    """Turn (column, day, value, weight) changes into {month: {column: {day: {bin index: count}}}}"""
+    por_mes = {}
+    for col, dia, value, weight in changes:
+        idx = str(int(np.searchsorted(SKETCH_EDGES[col], float(value), side='right')))
+        buckets = por_mes.setdefault(dia[:7], {}).setdefault(col, {}).setdefault(dia, {})
+        buckets[idx] = buckets.get(idx, 0) + weight
+    return por_mes
+
+def _update_sketches(changes):
+    """Apply sketch changes to the months they touch (skipped until the sketches are first built)"""
+    if not changes or not _tracking_sketches():
+        return
+    _merge_sketch_counts(_changes_to_counts(changes))
+
+def rebuild_sketches():
+    """
+    Rebuild the per-day sketches from the whole history (archive included)
+
+    Scans every record, so it belongs in a background job or a maintenance
+    script rather than in a request. The scan runs outside _file_lock: it
+    counts the records up to the highest ID seen at the start, except the
+    latest one, whose elasticity may still change. That record is counted as
+    it was at the start and every sketch delta committed during the scan is
+    replayed on top before the new sketches are swapped in.
+
+    Returns:
+        int: Number of records scanned
+    """
+    global _sketch_rebuild_log
+    with _maintenance_lock:
+        with _file_lock:
+            max_id = _max_id()
+            latest = _latest_record()
+            _sketch_rebuild_log = []
+        try:
+            latest_id = None if latest is None else latest['id']
+            por_mes = {}
+            rows = 0
+            for chunk in iter_filtered_data(None):
+                chunk = chunk[(chunk['id'] <= max_id) & (chunk['id'] != latest_id)]
+                rows += len(chunk)
+                _add_chunk_to_sketches(por_mes, chunk)
+
+            with _file_lock:
+                if latest is not None:
+                    rows += 1
+                    _sketch_rebuild_log.insert(0, _changes_to_counts(_record_sketch_changes(latest)))
+                for delta in _sketch_rebuild_log:
+                    for mes, novos in delta.items():
+                        _add_month_counts(por_mes.setdefault(mes, {}), novos)
+
+                # Write every month to a new directory and swap it in at the end
+                tmp_dir = f"{_sketch_dir()}.tmp"
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                os.makedirs(tmp_dir)
+                for mes, stored in por_mes.items():
+                    _save_sketch_month(mes, stored, tmp_dir)
+                old_dir = f"{_sketch_dir()}.old"
+                if os.path.isdir(_sketch_dir()):
+                    os.replace(_sketch_dir(), old_dir)
+                os.replace(tmp_dir, _sketch_dir())
+                shutil.rmtree(old_dir, ignore_errors=True)
+        finally:
+            with _file_lock:
+                _sketch_rebuild_log = None
+    return rows
+
+def _add_chunk_to_sketches(por_mes, chunk):
+    """Count a whole chunk of records into {month: {column: {day: {bin index: count}}}} (vectorized per column)"""
+    dias = pd.to_datetime(chunk['data_adicionada']).dt.strftime('%Y-%m-%d')
+    for col, edges in SKETCH_EDGES.items():
+        valid = chunk[col].notna()
+        bins = np.searchsorted(edges, chunk.loc[valid, col].to_numpy(dtype=float), side='right')
+        counts = pd.Series(1, index=pd.MultiIndex.from_arrays([dias[valid], bins])).groupby(level=[0, 1]).sum()
+        for (dia, idx), count in counts.items():
+            buckets = por_mes.setdefault(dia[:7], {}).setdefault(col, {}).setdefault(dia, {})
+            buckets[str(idx)] = buckets.get(str(idx), 0) + int(count)
+
+def get_distribution(column, days=None):
+    """
+    Get the distribution of a column for a time period from the stored sketches
+
+    The answer merges one small sketch per day, read only from the months the
+    period reaches, instead of scanning records. Periods are resolved to
+    whole days.
+
+    Args:
+        column (str): 'elasticidade' or 'precoFinal'
+        days (int, optional): Number of days to include. None uses all data.
+
+    Returns:
+        sketches.BinnedSketch: Use .quantile(), .histogram() and .count on it.
+        None while the sketches of an existing history haven't been built yet
+        (see rebuild_sketches).
+    """
+    if not has_sketches():
+        return None
+
+    primeiro_dia = None
+    if days is not None:
+        primeiro_dia = _sketch_day(datetime.now() - pd.Timedelta(days=days))
+
+    try:
+        return _merge_sketch_days(column, primeiro_dia)
+    except FileNotFoundError:
+        # rebuild_sketches swapped the directory mid-read; the swap holds the lock
+        with _file_lock:
+            if not has_sketches():
+                return None
+            return _merge_sketch_days(column, primeiro_dia)
+
+def _merge_sketch_days(column, primeiro_dia):
+    """Merge the stored per-day sketches of a column from primeiro_dia on"""
+    merged = sketches.BinnedSketch(SKETCH_EDGES[column])
+    for mes in _sketch_months(primeiro_dia):
+        for dia, buckets in _load_sketch_month(mes).get(column, {}).items():
+            if primeiro_dia is None or dia >= primeiro_dia:
+                merged.add_sparse(buckets)
+    return merged
+
+
+# Columns an import file must provide (elasticidade is optional and computed when missing)
+IMPORT_REQUIRED_COLUMNS = ['data_adicionada', 'precoInicio', 'precoFinal', 'quantidadeInicio', 'quantidadeFinal']
+
+def _iter_import_chunks(source, formato, chunksize):
+    """Stream an import file as DataFrame chunks"""
+    if formato == 'csv':
+        yield from pd.read_csv(source, chunksize=chunksize)
+        return
+
+    from openpyxl import load_workbook
+
+    # Read-only mode streams rows instead of loading the whole workbook
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(col).strip() if col is not None else '' for col in next(rows, [])]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        wb.close()
+
+def _validate_import_chunk(chunk):
+    """
+    Coerce a chunk to the database schema and drop rows that can't be stored
+
+    Returns:
+        tuple: (valid records with BASE_COLUMNS minus 'id', number of rejected rows)
+    """
+    missing = [col for col in IMPORT_REQUIRED_COLUMNS if col not in chunk.columns]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes no arquivo: {missing}")
+
+    df = pd.DataFrame({'data_adicionada': pd.to_datetime(chunk['data_adicionada'], errors='coerce')})
+    for col in IMPORT_REQUIRED_COLUMNS[1:]:
+        df[col] = pd.to_numeric(chunk[col], errors='coerce')
+    if 'elasticidade' in chunk.columns:
+        df['elasticidade'] = pd.to_numeric(chunk['elasticidade'], errors='coerce')
+    else:
+        df['elasticidade'] = np.nan
+
+    valid = (
+        df[IMPORT_REQUIRED_COLUMNS].notna().all(axis=1)
+        & (df['precoInicio'] > 0) & (df['precoFinal'] > 0)
+        & (df['quantidadeInicio'] >= 0) & (df['quantidadeFinal'] >= 0)
+    )
+    df = df[valid].reset_index(drop=True)
+
+    # Fill in missing elasticities with the vectorized midpoint formula
+    sem_elasticidade = df['elasticidade'].isna()
+    if sem_elasticidade.any():
+        calculada = m.elasticidade_vetorizada(df['quantidadeInicio'], df['quantidadeFinal'],
+                                              df['precoInicio'], df['precoFinal'])
+        df['elasticidade'] = df['elasticidade'].where(~sem_elasticidade, calculada)
+
+    df['data_adicionada'] = df['data_adicionada'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df, int((~valid).sum())
+
+def _commit_import_chunk(df, state):
+    """
+    Assign IDs to validated records and append them in one write
+
+    `state` carries the next ID and the hot file's size between the chunks of
+    one import, so the IDs are only read again when another writer changed the
+    file in the meantime.
+    """
+    with _file_lock:
+        if _partitioned():
+            manifest = _load_partition_manifest()
+            next_id = manifest['max_id'] + 1
+        else:
+            if state.get('tamanho') != os.path.getsize(DATA_FILE):
+                ids = pd.read_csv(DATA_FILE, usecols=['id'])['id']
+                state['proximo_id'] = 1 if ids.empty else int(ids.max()) + 1
+                state['colunas'] = list(pd.read_csv(DATA_FILE, nrows=0).columns)
+            next_id = state['proximo_id']
+
+        df.insert(0, 'id', np.arange(next_id, next_id + len(df), dtype=np.int64))
+        df = compute_derived_columns(df).reindex(columns=COLUMNS)
+
+        if _partitioned():
+            _append_to_partitions(manifest, df)
+        else:
+            # New IDs go at the end, so the hot file is appended to instead of rewritten
+            _append_csv(DATA_FILE, df.reindex(columns=state['colunas']))
+            state['proximo_id'] = next_id + len(df)
+            state['tamanho'] = os.path.getsize(DATA_FILE)
+
+        if _tracking_sketches():
+            por_mes = {}
+            _add_chunk_to_sketches(por_mes, df)
+            _merge_sketch_counts(por_mes)
+
+def _current_rss_mb():
+    """Current resident memory of the process in MB (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def import_data(source, formato='csv', chunksize=EXPORT_CHUNKSIZE, rastrear_memoria=False):
+    """
+    Bulk import historical records from a CSV or Excel file
+
+    The file is streamed in chunks; each chunk is validated and coerced to the
+    database schema, gets its IDs in one block, has missing elasticities
+    computed vectorized and is committed with a single append. Chunks already
+    committed stay in the database if a later one fails.
+
+    Args:
+        source (str or file-like): Path or buffer of the file to import
+        formato (str): 'csv' or 'xlsx'
+        chunksize (int): Number of rows validated and committed at a time
+        rastrear_memoria (bool): Also measure the import's own peak allocations
+            with tracemalloc (exact but makes the import several times slower)
+
+    Returns:
+        dict: 'importadas' and 'rejeitadas' row counts, 'segundos',
+        'linhas_por_segundo', 'aumento_rss_mb' (largest growth of the process's
+        resident memory over its size when the import started, sampled after
+        each chunk; None where it can't be read) and, with rastrear_memoria,
+        'pico_memoria_mb'
+
+    Raises:
+        ValueError: If the format or the file is invalid. When earlier chunks
+            were already committed the message says how many records they held.
+    """
+    if formato not in ('csv', 'xlsx'):
+        raise ValueError(f"Formato de importação inválido: {formato}. Use 'csv' ou 'xlsx'")
+
+    create_database()
+    tracing = tracemalloc.is_tracing()
+    if rastrear_memoria:
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    rss_inicial = rss_maximo = _current_rss_mb()
+    start = time.perf_counter()
+
+    importadas = rejeitadas = 0
+    pico = None
+    estado_ids = {}
+    try:
+        for chunk in _iter_import_chunks(source, formato, chunksize):
+            validos, invalidos = _validate_import_chunk(chunk)
+            rejeitadas += invalidos
+            if not validos.empty:
+                _commit_import_chunk(validos, estado_ids)
+                importadas += len(validos)
+            if rss_inicial is not None:
+                # Sampled while the chunk is still alive
+                rss_maximo = max(rss_maximo, _current_rss_mb())
+    except ValueError as exc:
+        if importadas:
+            raise ValueError(f"{str(exc).rstrip('.')}. {importadas} registros dos blocos anteriores "
+                             f"já foram importados e permanecem no banco de dados.") from exc
+        raise
+    finally:
+        segundos = time.perf_counter() - start
+        if rastrear_memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+
+    relatorio = {
+        'importadas': importadas,
+        'rejeitadas': rejeitadas,
+        'segundos': segundos,
+        'linhas_por_segundo': importadas / segundos if segundos > 0 else float('inf'),
+        'aumento_rss_mb': None if rss_inicial is None else rss_maximo - rss_inicial
+    }
+    if pico is not None:
+        relatorio['pico_memoria_mb'] = pico / 1024 ** 2
+    return relatorio
@@ -5,10 +5,15 @@ import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import numpy as np
 import plotly.express as px
+import tempfile
+import weakref
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 # Import improved modules
 import main as m
 import database as db
+import profiling
 
 # Set page configuration
 st.set_page_config(
@@ -18,6 +23,10 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Memory profiling mode (MEMORY_PROFILE=1): allocations are attributed to each section below
+profiler = profiling.SectionProfiler(state=st.session_state)
+profiler.mark("Configuração e carga de dados")
+
 # Apply custom CSS for better styling
 st.markdown("""
 <style>
@@ -61,10 +70,79 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Create database if it doesn't exist
-db.create_database()
+# When DATA_SERVICE_URL is set, reads and writes go through the shared data service (service.py)
+DATA_SERVICE_URL = os.environ.get("DATA_SERVICE_URL")
+
+@st.cache_resource
+def get_data_store():
+    """Return the pooled service client, or the database module for direct file access"""
+    if DATA_SERVICE_URL:
+        import service
+        return service.ServiceClient(DATA_SERVICE_URL)
+    return db
+
+store = get_data_store()
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def archive_old_records():
+    """Move records older than the retention window to the archive, at most once a day"""
+    return db.archive_old_data(db.RETENTION_DAYS)
+
+if not DATA_SERVICE_URL:
+    # Create database if it doesn't exist and bring older files up to the current schema
+    db.create_database()
+    db.migrate_database()
+
+    # Coalesce concurrent registrations from several sessions into group commits
+    db.start_background_writer()
+
+    archive_old_records()
+
+# Analysis periods offered in "Desempenho do Negócio" (number of days, None for all)
+periodo_map = {
+    "Todos os registros": None,
+    "Última semana": 7,
+    "Últimos 15 dias": 15,
+    "Último mês": 30,
+    "Últimos 2 meses": 60,
+    "Últimos 3 meses": 90,
+    "Últimos 4 meses": 120
+}
+
+@st.cache_resource
+def get_load_executor():
+    """Thread pool shared by all sessions to read the history off the script thread"""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def build_missing_sketches():
+    """Build the distribution sketches of a history stored before they existed, off the script thread"""
+    return get_load_executor().submit(db.rebuild_sketches)
+
+if not DATA_SERVICE_URL and not db.has_sketches():
+    build_missing_sketches()
+
+def start_history_load():
+    """Start reading the latest record and the selected period's history in the background"""
+    executor = get_load_executor()
+    dias = periodo_map[st.session_state.get('periodo', "Todos os registros")]
+    return executor.submit(store.get_latest_data), executor.submit(store.get_filtered_data, dias)
+
+def wait_for(future, mensagem):
+    """Show a placeholder while a background load finishes and return its result"""
+    if future.done():
+        return future.result()
+    placeholder = st.empty()
+    placeholder.info(f"⏳ {mensagem}")
+    resultado = future.result()
+    placeholder.empty()
+    return resultado
+
+# Start loading the history now so the cost and pricing sections paint without waiting for it
+latest_future, filtered_future = start_history_load()
 
 # App title and introduction
+profiler.mark("Introdução")
 st.markdown('<h1 class="main-header">🥪 Lanchonete do Amaro - Análise de Preços</h1>', unsafe_allow_html=True)
 
 col_intro1, col_intro2 = st.columns([2, 1])
@@ -82,6 +160,7 @@ with col_intro2:
 st.markdown("<hr>", unsafe_allow_html=True)
 
 # Section 1: Production Costs
+profiler.mark("Custos de Produção")
 st.markdown('<h2 class="section-header">📊 Custos de Produção do Salgado</h2>', unsafe_allow_html=True)
 
 col1, col2, col3, col4 = st.columns(4)
@@ -115,6 +194,7 @@ with col_result3:
 st.markdown("<br>", unsafe_allow_html=True)
 
 # Section 2: Pricing and Sales
+profiler.mark("Preço de Venda")
 st.markdown('<h2 class="section-header">🏷️ Definição do Preço de Venda</h2>', unsafe_allow_html=True)
 
 col5, col6 = st.columns(2)
@@ -148,7 +228,7 @@ with col_btn1:
     if inserir_dados:
         if preco_unidade is not None:
             # Insert data into the database
-            db.insert_data(
+            store.insert_data(
                 data_adicionada=db.get_current_date(),
                 precoInicio=preco_unidade,
                 precoFinal=preco_final,
@@ -157,16 +237,111 @@ with col_btn1:
                 elasticidade=None
             )
             st.success("✅ Dados registrados com sucesso!")
+            
+            # Reload so the sections below include the new record
+            latest_future, filtered_future = start_history_load()
         else:
             st.error("❌ Erro: Calcule o preço sugerido antes de inserir os dados.")
 
+# Cost-structure sensitivity (what-if over all cost inputs at once)
+@st.cache_data(max_entries=32, show_spinner=False)
+def get_sensitivity(custo_unidade, custo_salarios, prod_por_dia, margem_lucro, variacao, passos):
+    """Sensitivity grid of the cost inputs, shared by all sessions"""
+    return m.analise_sensibilidade(custo_unidade, custo_salarios, prod_por_dia, margem_lucro,
+                                   variacao=variacao, passos=passos)
+
+with st.expander("🔬 Análise de sensibilidade dos custos"):
+    # The grid and its charts are only computed once the analysis is switched on
+    if st.toggle("Calcular análise de sensibilidade", key='sensibilidade'):
+        col_sens1, col_sens2 = st.columns(2)
+        with col_sens1:
+            variacao_sens = st.slider("Variação dos parâmetros (±%)", min_value=5, max_value=90, value=20, step=5)
+        with col_sens2:
+            passos_sens = st.slider("Valores por parâmetro", min_value=3, max_value=21, value=11, step=2)
+
+        sensibilidade = get_sensitivity(custo_unidade, soma_salarios, producao_diaria, margem_lucro,
+                                        variacao_sens, passos_sens)
+        precos_grade = sensibilidade['precos']
+        st.caption(f"{precos_grade.size:,} combinações avaliadas · preço sugerido entre "
+                   f"R$ {precos_grade.min():.2f} e R$ {precos_grade.max():.2f}")
+
+        col_sens3, col_sens4 = st.columns(2)
+        with col_sens3:
+            st.markdown('<p class="chart-title">Impacto no Preço Sugerido (R$)</p>', unsafe_allow_html=True)
+
+            # Tornado chart: price change at each end of every input's range
+            tornado = sensibilidade['tornado'].iloc[::-1]
+            fig, ax = plt.subplots(figsize=(10, 5))
+            ax.barh(tornado['descricao'], tornado['preco_baixo'] - tornado['preco_base'],
+                    color='#3498db', alpha=0.7, label=f'-{variacao_sens}%')
+            ax.barh(tornado['descricao'], tornado['preco_alto'] - tornado['preco_base'],
+                    color='#e74c3c', alpha=0.7, label=f'+{variacao_sens}%')
+            ax.axvline(x=0, color='black', linewidth=1)
+            ax.set_xlabel(f'Variação em relação a R$ {preco_sugerido:.2f}')
+            plt.grid(True, alpha=0.3, axis='x')
+            plt.legend(loc='lower right')
+            plt.tight_layout()
+            st.pyplot(fig)
+            plt.close(fig)
+
+        with col_sens4:
+            st.markdown('<p class="chart-title">Produção de Equilíbrio ao Preço de Venda</p>', unsafe_allow_html=True)
+
+            # Break-even production for each ingredient cost, at low/current/high salary costs
+            custos_faixa = sensibilidade['faixas'][0]
+            salarios_faixa = sensibilidade['faixas'][1][[0, len(sensibilidade['faixas'][1]) // 2, -1]]
+            equilibrio = m.producao_equilibrio(custos_faixa[None, :], salarios_faixa[:, None], preco_final)
+
+            fig, ax = plt.subplots(figsize=(10, 5))
+            for salarios, linha in zip(salarios_faixa, equilibrio):
+                ax.plot(custos_faixa, linha, 'o-', linewidth=2, label=f'Salários R$ {salarios:.0f}')
+            ax.axhline(y=producao_diaria, color='#7f8c8d', linestyle='--', alpha=0.7, label='Produção atual')
+            ax.set_xlabel('Custo dos ingredientes (R$)')
+            ax.set_ylabel('Salgados por dia')
+            plt.grid(True, alpha=0.3)
+            plt.legend(loc='upper left')
+            plt.tight_layout()
+            st.pyplot(fig)
+            plt.close(fig)
+
+            equilibrio_atual = m.producao_equilibrio(custo_unidade, soma_salarios, preco_final)
+            if np.isfinite(equilibrio_atual):
+                st.metric("Produção de equilíbrio atual", f"{equilibrio_atual:.0f} salgados/dia")
+            else:
+                st.error("❌ O preço de venda não cobre o custo dos ingredientes.")
+
+# Bulk import of historical sales data
+with st.expander("📤 Importar histórico de vendas"):
+    st.caption("Arquivo CSV ou Excel com as colunas data_adicionada, precoInicio, precoFinal, "
+               "quantidadeInicio e quantidadeFinal (elasticidade é opcional e calculada quando ausente).")
+    arquivo_importacao = st.file_uploader("Arquivo de histórico", type=["csv", "xlsx"])
+    if DATA_SERVICE_URL:
+        st.info("A importação em lote grava direto nos arquivos de dados. Execute-a na máquina do serviço de dados.")
+    elif arquivo_importacao is not None and st.button("Importar registros"):
+        formato_importacao = "xlsx" if arquivo_importacao.name.lower().endswith(".xlsx") else "csv"
+        with st.spinner("Importando registros..."):
+            try:
+                relatorio = db.import_data(arquivo_importacao, formato_importacao)
+            except ValueError as exc:
+                relatorio = None
+                st.error(f"❌ {exc}")
+        if relatorio is not None:
+            st.success(f"✅ {relatorio['importadas']} registros importados "
+                       f"({relatorio['rejeitadas']} linhas inválidas ignoradas)")
+            col_imp1, col_imp2, col_imp3 = st.columns(3)
+            col_imp1.metric("Tempo", f"{relatorio['segundos']:.1f} s")
+            col_imp2.metric("Linhas por segundo", f"{relatorio['linhas_por_segundo']:,.0f}")
+            if relatorio['aumento_rss_mb'] is not None:
+                col_imp3.metric("Memória usada na importação", f"{relatorio['aumento_rss_mb']:.0f} MB")
+
 st.markdown("<br>", unsafe_allow_html=True)
 
 # Section 3: Elasticity Analysis
+profiler.mark("Análise de Elasticidade")
 st.markdown('<h2 class="section-header">📈 Análise de Elasticidade</h2>', unsafe_allow_html=True)
 
-# Get latest data from the database
-latest_data = db.get_latest_data()
+# Get latest data from the database (loaded in the background)
+latest_data = wait_for(latest_future, "Carregando o último registro...")
 
 col_analise1, col_analise2 = st.columns([1, 3])
 with col_analise1:
@@ -180,7 +355,10 @@ if calcular_elasticidade and latest_data:
     
     # Update elasticity in the database
     if elasticidade_valor is not None:
-        db.update_elasticity(elasticidade_valor)
+        store.update_elasticity(elasticidade_valor)
+        
+        # Reload the history so the charts below show the new elasticity
+        _, filtered_future = start_history_load()
         
         # Get interpretation
         status, mensagem = m.interpret_elasticity(elasticidade_valor)
@@ -223,6 +401,7 @@ if calcular_elasticidade and latest_data:
             
             # Display the chart
             st.pyplot(fig)
+            plt.close(fig)
     else:
         st.error("Não foi possível calcular a elasticidade com os dados fornecidos.")
 elif calcular_elasticidade:
@@ -231,30 +410,176 @@ elif calcular_elasticidade:
 st.markdown("<br>", unsafe_allow_html=True)
 
 # Section 4: Business Performance
+profiler.mark("Desempenho do Negócio")
 st.markdown('<h2 class="section-header">📊 Desempenho do Negócio</h2>', unsafe_allow_html=True)
 st.caption("Analise as tendências por período para tomar decisões estratégicas.")
 
 # Time period selection
 opcao = st.selectbox(
     "Selecione o período de análise", 
-    ("Todos os registros", "Última semana", "Últimos 15 dias", 
-     "Último mês", "Últimos 2 meses", "Últimos 3 meses", "Últimos 4 meses")
+    tuple(periodo_map),
+    key='periodo'
 )
 
 # Map option to number of days
-periodo_map = {
-    "Todos os registros": None,
-    "Última semana": 7,
-    "Últimos 15 dias": 15,
-    "Último mês": 30,
-    "Últimos 2 meses": 60,
-    "Últimos 3 meses": 90,
-    "Últimos 4 meses": 120
-}
 num_dias = periodo_map[opcao]
 
-# Get filtered data
-dados_filtrados = db.get_filtered_data(num_dias)
+@st.cache_resource
+def get_export_executor():
+    """Thread pool shared by all sessions so exports are built off the script thread"""
+    return ThreadPoolExecutor(max_workers=2)
+
+class ExportFile:
+    """Temporary export file, deleted when the session holding it ends (or the app stops)"""
+
+    def __init__(self, formato):
+        fd, self.path = tempfile.mkstemp(prefix="exportacao_", suffix=f".{formato}")
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def remove(self):
+        """Delete the file now"""
+        self._finalizer()
+
+    def reader(self):
+        """Return a callable reading the file, so it's only loaded when the download is clicked"""
+        path = self.path
+        def read():
+            with open(path, 'rb') as f:
+                return f.read()
+        return read
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# Export the selected period
+export_mime = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/octet-stream"
+}
+with st.expander("📥 Exportar dados do período"):
+    col_exp1, col_exp2 = st.columns([1, 2])
+    with col_exp1:
+        formato_exportacao = st.selectbox("Formato do arquivo", db.EXPORT_FORMATS,
+                                          format_func=lambda f: {"csv": "CSV", "xlsx": "Excel", "parquet": "Parquet"}[f])
+        preparar_exportacao = st.button("Preparar exportação", use_container_width=True)
+
+    if preparar_exportacao:
+        # Drop the file from a previous export of this session
+        exportacao_anterior = st.session_state.get('exportacao')
+        if exportacao_anterior:
+            exportacao_anterior['arquivo'].remove()
+
+        arquivo = ExportFile(formato_exportacao)
+        st.session_state['exportacao'] = {
+            'future': get_export_executor().submit(store.export_filtered_data, arquivo.path, formato_exportacao, num_dias),
+            'arquivo': arquivo,
+            'formato': formato_exportacao,
+            'periodo': opcao
+        }
+
+    with col_exp2:
+        exportacao = st.session_state.get('exportacao')
+        if exportacao is None:
+            st.caption("Escolha o formato e clique em 'Preparar exportação'.")
+        elif not exportacao['future'].done():
+            st.info(f"⏳ Gerando arquivo ({exportacao['periodo']})... Você pode continuar usando o painel.")
+            st.button("🔄 Verificar exportação")
+        elif exportacao['future'].exception() is not None:
+            st.error(f"❌ Erro ao exportar: {exportacao['future'].exception()}")
+        else:
+            st.success(f"✅ {exportacao['future'].result()} registros exportados ({exportacao['periodo']})")
+            # The file is only read when the button is clicked, not on every rerun
+            st.download_button(
+                "⬇️ Baixar arquivo",
+                data=exportacao['arquivo'].reader(),
+                file_name=f"dados_{datetime.now().strftime('%Y%m%d')}.{exportacao['formato']}",
+                mime=export_mime[exportacao['formato']],
+                use_container_width=True
+            )
+
+# The stamp changes with every write, so a cached summary is never stale; the
+# ttl bounds how far a period's sliding start can drift past old records
+@st.cache_data(max_entries=32, ttl=60 * 60, show_spinner=False)
+def get_weekly_summary(dias, stamp):
+    """Weekly totals and averages of the period, recomputed only when the stored records change"""
+    return store.aggregate_data('week', {
+        'lucro_total': ['sum'],
+        'quantidadeFinal': ['sum'],
+        'precoFinal': ['mean'],
+        'elasticidade': ['mean', 'count']
+    }, days=dias)
+
+# What-if projections: steps of the "Simular novo preço" input prewarmed around the current price
+PROJECTION_PRICE_STEP = 0.50
+PROJECTION_STEPS = 20
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_projection_table(preco_atual, quantidade_atual, custo_unitario, elasticidade):
+    """Projections for the common price steps around the current price, shared by all sessions"""
+    passos = np.arange(-PROJECTION_STEPS, PROJECTION_STEPS + 1) * PROJECTION_PRICE_STEP
+    precos = np.round(preco_atual + passos, 2)
+    tabela = m.projetar_cenarios(preco_atual, quantidade_atual, custo_unitario, precos[precos > 0], elasticidade)
+    return tabela.set_index('novo_preco', drop=False)
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def get_projection(preco_atual, quantidade_atual, custo_unitario, novo_preco, elasticidade):
+    """Projection of one simulated price, taken from the prewarmed table when it is one of its steps"""
+    tabela = get_projection_table(preco_atual, quantidade_atual, custo_unitario, elasticidade)
+    if round(novo_preco, 2) in tabela.index:
+        return tabela.loc[round(novo_preco, 2)].to_dict()
+    return m.projetar_cenarios(preco_atual, quantidade_atual, custo_unitario, novo_preco, elasticidade).iloc[0].to_dict()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_projection_chart(quantidade_atual, nova_quantidade, receita_atual, receita_nova):
+    """Draw the current vs projected sales/revenue chart once and return it as PNG bytes"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    
+    # Set bar positions
+    bar_width = 0.35
+    index = np.arange(2)
+    
+    # Create bars for quantity
+    bars1 = ax.bar(index - bar_width/2, [quantidade_atual, nova_quantidade], 
+                  bar_width, label='Vendas diárias', color='#3498db')
+    
+    # Create second y-axis for revenue
+    ax2 = ax.twinx()
+    bars2 = ax2.bar(index + bar_width/2, [receita_atual, receita_nova], 
+                   bar_width, label='Receita mensal', color='#e74c3c')
+    
+    # Add data labels
+    for bar in bars1:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height + 5,
+               f'{height:.0f}', ha='center', va='bottom')
+    
+    for bar in bars2:
+        height = bar.get_height()
+        ax2.text(bar.get_x() + bar.get_width()/2., height + 100,
+                f'R$ {height:.0f}', ha='center', va='bottom')
+    
+    # Format chart
+    ax.set_xticks(index)
+    ax.set_xticklabels(['Cenário Atual', 'Cenário Projetado'])
+    ax.set_ylabel('Vendas (unidades/dia)')
+    ax2.set_ylabel('Receita (R$/mês)')
+    
+    # Combine legends
+    lines1, labels1 = ax.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
+    
+    plt.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+# Get filtered data (loaded in the background since the script started)
+dados_filtrados = wait_for(filtered_future, "Carregando o histórico do período...")
 
 # Check if we have data to display
 if not dados_filtrados.empty:
@@ -265,15 +590,11 @@ if not dados_filtrados.empty:
     dados_filtrados['data_formatada'] = dados_filtrados['data_adicionada'].dt.strftime('%d/%m/%Y')
     
     # Ensure all numeric columns are properly formatted
-    numeric_cols = ['precoInicio', 'precoFinal', 'quantidadeInicio', 'quantidadeFinal', 'elasticidade']
+    # (profit columns are computed once when each record is inserted)
+    numeric_cols = ['precoInicio', 'precoFinal', 'quantidadeInicio', 'quantidadeFinal', 'elasticidade'] + db.DERIVED_COLUMNS
     for col in numeric_cols:
         dados_filtrados[col] = pd.to_numeric(dados_filtrados[col], errors='coerce')
 
-    # Calculate profit values for charts
-    dados_filtrados['lucro_unitario'] = dados_filtrados['precoFinal'] - dados_filtrados['precoInicio']
-    dados_filtrados['lucro_total'] = dados_filtrados['lucro_unitario'] * dados_filtrados['quantidadeFinal']
-    dados_filtrados['margem_percentual'] = (dados_filtrados['lucro_unitario'] / dados_filtrados['precoFinal']) * 100
-
     # Create tabs for different visualizations
     tab1, tab2, tab3 = st.tabs(["Análise de Preços e Vendas", "Elasticidade e Tendências", "Projeções"])
 
@@ -306,6 +627,7 @@ if not dados_filtrados.empty:
             
             # Show the chart
             st.pyplot(fig)
+            plt.close(fig)
             
         with col_chart2:
             st.markdown('<p class="chart-title">Quantidade Vendida vs. Produção (unidades/mês)</p>', unsafe_allow_html=True)
@@ -354,6 +676,7 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
         
         # Second row of charts
         col_chart3, col_chart4 = st.columns(2)
@@ -379,6 +702,7 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
             
         with col_chart4:
             st.markdown('<p class="chart-title">Comparativo de Preço e Margem (%)</p>', unsafe_allow_html=True)
@@ -408,6 +732,22 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
+
+        # Weekly summary aggregated inside the database layer
+        st.markdown('<p class="chart-title">Resumo Semanal</p>', unsafe_allow_html=True)
+        resumo_semanal = get_weekly_summary(num_dias, store.data_stamp())
+        if resumo_semanal.empty:
+            st.info("Nenhum registro no período selecionado.")
+        else:
+            resumo_semanal.index = resumo_semanal.index.strftime('%d/%m/%Y')
+            st.dataframe(resumo_semanal.rename(columns={
+                'lucro_total_sum': 'Lucro total (R$)',
+                'quantidadeFinal_sum': 'Vendas (unidades)',
+                'precoFinal_mean': 'Preço médio (R$)',
+                'elasticidade_mean': 'Elasticidade média',
+                'elasticidade_count': 'Registros com elasticidade'
+            }).rename_axis('Semana'), use_container_width=True)
 
     with tab2:
         # First row of elasticity charts
@@ -441,6 +781,7 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
             
         with col_elast2:
             st.markdown('<p class="chart-title">Distribuição da Elasticidade</p>', unsafe_allow_html=True)
@@ -448,24 +789,22 @@ if not dados_filtrados.empty:
             # Create histogram of elasticity values
             fig, ax = plt.subplots(figsize=(10, 5))
             
-            # Filter out nan values
-            elasticity_values = dados_filtrados['elasticidade'].dropna()
+            # Distribution answered from the per-day sketches kept by the database
+            distribuicao_elasticidade = store.get_distribution('elasticidade', num_dias)
             
-            if not elasticity_values.empty:
+            if distribuicao_elasticidade is None:
+                # The sketches of an older history are still being built in the background
+                ax.text(0.5, 0.5, "Distribuição em preparo, atualize a página em instantes", 
+                       ha='center', va='center', transform=ax.transAxes)
+            elif distribuicao_elasticidade.count > 0:
                 # Create histogram
                 bins = np.linspace(-3, 3, 15)  # Create 15 bins between -3 and 3
-                n, bins, patches = ax.hist(elasticity_values, bins=bins, 
-                                         color='#9b59b6', alpha=0.7, edgecolor='black')
+                n = distribuicao_elasticidade.histogram(bins)
                 
-                # Color bins based on elasticity interpretation
+                # Color bins based on elasticity interpretation (one vectorized pass)
                 bin_centers = 0.5 * (bins[:-1] + bins[1:])
-                for i, patch in enumerate(patches):
-                    if bin_centers[i] < -1:
-                        patch.set_facecolor('#e74c3c')  # Red for highly elastic
-                    elif -1 <= bin_centers[i] < 0:
-                        patch.set_facecolor('#f39c12')  # Orange for elastic
-                    else:
-                        patch.set_facecolor('#2ecc71')  # Green for inelastic/premium
+                ax.bar(bin_centers, n, width=np.diff(bins), color=m.elasticity_colors(bin_centers),
+                       alpha=0.7, edgecolor='black')
                 
                 # Add vertical lines for reference
                 ax.axvline(x=-1, color='black', linestyle='--', alpha=0.7)
@@ -487,6 +826,29 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
+            
+            # Percentile summary from the same sketches
+            distribuicao_preco = store.get_distribution('precoFinal', num_dias)
+            if distribuicao_elasticidade is not None and distribuicao_elasticidade.count > 0:
+                p10, p50, p90 = distribuicao_elasticidade.quantile([0.1, 0.5, 0.9])
+                st.caption(f"Elasticidade — P10: {p10:.2f} · P50: {p50:.2f} · P90: {p90:.2f}")
+            if distribuicao_preco is not None and distribuicao_preco.count > 0:
+                p10, p50, p90 = distribuicao_preco.quantile([0.1, 0.5, 0.9])
+                st.caption(f"Preço de venda — P10: R$ {p10:.2f} · P50: R$ {p50:.2f} · P90: R$ {p90:.2f}")
+        
+        # Regime breakdown for the selected period
+        st.markdown('<p class="chart-title">Distribuição por Regime de Elasticidade</p>', unsafe_allow_html=True)
+        _, regimes = m.elasticity_breakdown(dados_filtrados['elasticidade'])
+        st.dataframe(
+            regimes[['descricao', 'quantidade', 'participacao']].rename(columns={
+                'descricao': 'Regime',
+                'quantidade': 'Registros',
+                'participacao': 'Participação (%)'
+            }).style.format({'Participação (%)': '{:.1f}'}),
+            hide_index=True,
+            use_container_width=True
+        )
         
         # Second row of elasticity charts
         col_elast3, col_elast4 = st.columns(2)
@@ -525,6 +887,7 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
             
         with col_elast4:
             st.markdown('<p class="chart-title">Elasticidade vs Quantidade Vendida</p>', unsafe_allow_html=True)
@@ -578,6 +941,7 @@ if not dados_filtrados.empty:
             
             plt.tight_layout()
             st.pyplot(fig)
+            plt.close(fig)
 
     with tab3:
         # Predictions and projections tab
@@ -620,66 +984,32 @@ if not dados_filtrados.empty:
             st.write("")  # Spacer
             simular = st.button("🧮 Simular Cenário", use_container_width=True)
             
+        # Projections around the current price are computed before the first click
+        custo_unitario = preco_unidade
+        get_projection_table(float(current_price), float(current_quantity), custo_unitario, usar_elasticidade)
+        
         # Run projection if button is clicked
         if simular:
-            # Calculate projected sales
-            variacao_preco = (novo_preco - current_price) / current_price
-            variacao_quantidade = variacao_preco * usar_elasticidade
-            nova_quantidade = current_quantity * (1 + variacao_quantidade)
+            # Projected sales, revenue and profit (cached per price/elasticity pair)
+            projecao = get_projection(float(current_price), float(current_quantity), custo_unitario,
+                                      novo_preco, usar_elasticidade)
+            nova_quantidade = projecao['nova_quantidade']
+            receita_nova = projecao['receita_nova']
+            lucro_novo = projecao['lucro_novo']
             
             # Display projection results
             col_res1, col_res2 = st.columns(2)
             
             with col_res1:
-                # Create comparison chart
-                fig, ax = plt.subplots(figsize=(10, 6))
-                
-                # Set bar positions
-                bar_width = 0.35
-                index = np.arange(2)
-                
-                # Calculate revenue
-                receita_atual = current_price * current_quantity * 30  # Monthly revenue
-                receita_nova = novo_preco * nova_quantidade * 30  # Monthly revenue
-                
-                # Create bars for quantity
-                bars1 = ax.bar(index - bar_width/2, [current_quantity, nova_quantidade], 
-                              bar_width, label='Vendas diárias', color='#3498db')
-                
-                # Create second y-axis for revenue
-                ax2 = ax.twinx()
-                bars2 = ax2.bar(index + bar_width/2, [receita_atual, receita_nova], 
-                               bar_width, label='Receita mensal', color='#e74c3c')
-                
-                # Add data labels
-                for bar in bars1:
-                    height = bar.get_height()
-                    ax.text(bar.get_x() + bar.get_width()/2., height + 5,
-                           f'{height:.0f}', ha='center', va='bottom')
-                
-                for bar in bars2:
-                    height = bar.get_height()
-                    ax2.text(bar.get_x() + bar.get_width()/2., height + 100,
-                            f'R$ {height:.0f}', ha='center', va='bottom')
-                
-                # Format chart
-                ax.set_xticks(index)
-                ax.set_xticklabels(['Cenário Atual', 'Cenário Projetado'])
-                ax.set_ylabel('Vendas (unidades/dia)')
-                ax2.set_ylabel('Receita (R$/mês)')
-                
-                # Combine legends
-                lines1, labels1 = ax.get_legend_handles_labels()
-                lines2, labels2 = ax2.get_legend_handles_labels()
-                ax.legend(lines1 + lines2, labels1 + labels2, loc='upper left')
-                
-                plt.tight_layout()
-                st.pyplot(fig)
+                # Comparison chart, drawn once per projection
+                st.image(render_projection_chart(float(current_quantity), nova_quantidade,
+                                                 projecao['receita_atual'], receita_nova),
+                         use_container_width=True)
                 
             with col_res2:
                 # Display impact metrics
-                variacao_percentual_vendas = variacao_quantidade * 100
-                variacao_percentual_receita = ((receita_nova - receita_atual) / receita_atual) * 100
+                variacao_percentual_vendas = projecao['variacao_vendas']
+                variacao_percentual_receita = projecao['variacao_receita']
                 
                 st.markdown("### Impacto Projetado")
                 
@@ -694,11 +1024,8 @@ if not dados_filtrados.empty:
                 else:
                     st.warning(f"💰 Receita: {variacao_percentual_receita:.1f}% (R$ {receita_nova:.2f}/mês)")
                 
-                # Calculate profit metrics
-                custo_unitario = preco_unidade
-                lucro_atual = (current_price - custo_unitario) * current_quantity * 30
-                lucro_novo = (novo_preco - custo_unitario) * nova_quantidade * 30
-                variacao_percentual_lucro = ((lucro_novo - lucro_atual) / lucro_atual) * 100
+                # Profit metrics
+                variacao_percentual_lucro = projecao['variacao_lucro']
                 
                 if variacao_percentual_lucro >= 0:
                     st.success(f"✅ Lucro: +{variacao_percentual_lucro:.1f}% (R$ {lucro_novo:.2f}/mês)")
@@ -707,9 +1034,9 @@ if not dados_filtrados.empty:
                 
                 # Provide recommendation
                 st.markdown("### Recomendação")
-                if variacao_percentual_lucro > 5:
+                if projecao['recomendacao'] == "recomendado":
                     st.markdown(f'<div class="insight-box success">✅ <b>Recomendado:</b> A alteração para R$ {novo_preco:.2f} deve gerar um aumento significativo no lucro. Considere implementar esta mudança.</div>', unsafe_allow_html=True)
-                elif variacao_percentual_lucro > 0:
+                elif projecao['recomendacao'] == "testar":
                     st.markdown(f'<div class="insight-box info">ℹ️ <b>Considere testar:</b> A alteração para R$ {novo_preco:.2f} deve gerar um pequeno aumento no lucro. Recomenda-se testar em parte do negócio primeiro.</div>', unsafe_allow_html=True)
                 else:
                     st.markdown(f'<div class="insight-box warning">⚠️ <b>Não recomendado:</b> A alteração para R$ {novo_preco:.2f} deve reduzir o lucro total. Mantenha o preço atual ou considere outras opções.</div>', unsafe_allow_html=True)
@@ -758,10 +1085,25 @@ else:
     st.info("Os gráficos acima são apenas exemplos. Registre dados reais para obter análises personalizadas.")
 
 # Add footer with information
+profiler.mark("Rodapé")
 st.markdown("<hr>", unsafe_allow_html=True)
 st.markdown("""
 <div style="text-align: center; color: #666;">
     <small>Lanchonete do Amaro - Sistema de Análise de Preços © 2025</small><br>
     <small>Desenvolvido com ❤️ usando Streamlit e Pandas</small>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Memory profiling report for this rerun
+if profiler.enabled:
+    relatorio_secoes, retidos = profiler.report()
+    with st.sidebar.expander("🧠 Perfil de memória (esta execução)", expanded=True):
+        st.dataframe(relatorio_secoes.rename(columns={
+            'secao': 'Seção',
+            'variacao_kb': 'Variação (KB)',
+            'maiores_alocacoes': 'Maiores alocações'
+        }), hide_index=True, use_container_width=True)
+        if retidos:
+            st.caption("Memória retida desde a execução anterior:")
+            for linha in retidos:
+                st.text(linha)
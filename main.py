@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 def preco_unidade(custo_unidade, custo_salarios, prod_por_dia):
     """
@@ -70,6 +71,33 @@ def elasticidade(q_inicio, q_final, p_inicio, p_final):
     
     return epd
 
+def elasticidade_vetorizada(q_inicio, q_final, p_inicio, p_final):
+    """
+    Calculate price elasticity of demand for whole arrays at once
+    
+    Uses the same midpoint formula as elasticidade.
+    
+    Args:
+        q_inicio (array-like): Initial quantities before price change
+        q_final (array-like): Final quantities after price change
+        p_inicio (array-like): Initial prices before change
+        p_final (array-like): Final prices after change
+    
+    Returns:
+        numpy.ndarray: Elasticity values (NaN where elasticidade would return None)
+    """
+    q_inicio, q_final, p_inicio, p_final = (np.asarray(v, dtype=float) for v in (q_inicio, q_final, p_inicio, p_final))
+    
+    # Same cases as elasticidade: avoid division by zero
+    invalido = (q_inicio == 0) | (p_inicio == 0) | (p_inicio == p_final)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q_avg = (q_inicio + q_final) / 2
+        p_avg = (p_inicio + p_final) / 2
+        epd = ((q_final - q_inicio) / q_avg) / ((p_final - p_inicio) / p_avg)
+    
+    return np.where(invalido, np.nan, epd)
+
 def interpret_elasticity(epd):
     """
     Interpret elasticity value and provide business insights
@@ -96,6 +124,197 @@ def interpret_elasticity(epd):
     else:
         return "info", "Resultado inconclusivo. Considere coletar mais dados."
 
+# Inputs swept by analise_sensibilidade, in argument order, with their display labels
+SENSITIVITY_PARAMS = [
+    ("custo_unidade", "Custo dos ingredientes"),
+    ("custo_salarios", "Custos com funcionários"),
+    ("prod_por_dia", "Produção diária"),
+    ("margem_lucro", "Margem de lucro"),
+]
+
+def analise_sensibilidade(custo_unidade, custo_salarios, prod_por_dia, margem_lucro, variacao=20, passos=11):
+    """
+    Evaluate the final price over every combination of the cost inputs at once
+
+    Each input is swept from -variacao% to +variacao% of its current value and
+    the whole grid (passos ** 4 combinations) is computed in a single broadcast
+    NumPy evaluation of preco_unidade and preco_final.
+
+    Args:
+        custo_unidade (float): Cost of ingredients per unit
+        custo_salarios (float): Monthly salary costs
+        prod_por_dia (float): Daily production of snacks
+        margem_lucro (float): Desired profit margin (%)
+        variacao (float): Range swept around each input (%), below 100
+        passos (int): Number of values per input
+
+    Returns:
+        dict: 'faixas' (values swept per input, shape (4, passos)), 'precos'
+        (final price per combination, shape (passos,) * 4) and 'tornado'
+        (DataFrame with the price at the low/high end of each input, the others
+        kept at their current value, sorted by impact)
+    """
+    base = np.array([custo_unidade, custo_salarios, prod_por_dia, margem_lucro], dtype=float)
+    fatores = np.linspace(1 - variacao / 100, 1 + variacao / 100, passos)
+    faixas = base[:, None] * fatores
+
+    # Sparse grids broadcast to the full passos ** 4 result without materializing the inputs
+    c_unid, c_sal, prod, margem = np.meshgrid(*faixas, indexing='ij', sparse=True)
+    precos = preco_final(preco_unidade(c_unid, c_sal, prod), margem)
+
+    # One-at-a-time scenarios: row 2*i is input i at its low end, row 2*i+1 at its high end
+    cenarios = np.repeat(base[None, :], 2 * len(base), axis=0)
+    for i in range(len(base)):
+        cenarios[2 * i, i] = faixas[i, 0]
+        cenarios[2 * i + 1, i] = faixas[i, -1]
+    precos_cenario = preco_final(preco_unidade(cenarios[:, 0], cenarios[:, 1], cenarios[:, 2]), cenarios[:, 3])
+
+    preco_base = preco_final(preco_unidade(*base[:3]), base[3])
+    tornado = pd.DataFrame({
+        'parametro': [name for name, _ in SENSITIVITY_PARAMS],
+        'descricao': [label for _, label in SENSITIVITY_PARAMS],
+        'preco_baixo': precos_cenario[0::2],
+        'preco_alto': precos_cenario[1::2],
+    })
+    tornado['impacto'] = (tornado['preco_alto'] - tornado['preco_baixo']).abs()
+    tornado['preco_base'] = preco_base
+
+    return {
+        'faixas': faixas,
+        'precos': precos,
+        'tornado': tornado.sort_values('impacto', ascending=False, ignore_index=True)
+    }
+
+def producao_equilibrio(custo_unidade, custo_salarios, preco_venda):
+    """
+    Calculate the daily production at which the selling price covers the unit cost
+
+    Works element-wise on arrays, so whole grids of inputs can be evaluated at once.
+
+    Args:
+        custo_unidade (float or array): Cost of ingredients per unit
+        custo_salarios (float or array): Monthly salary costs
+        preco_venda (float or array): Selling price
+
+    Returns:
+        float or numpy.ndarray: Break-even daily production (inf when the price
+        doesn't even cover the ingredients)
+    """
+    margem_contribuicao = np.asarray(preco_venda, dtype=float) - custo_unidade
+    with np.errstate(divide='ignore', invalid='ignore'):
+        producao = np.where(margem_contribuicao > 0, custo_salarios / (margem_contribuicao * 30), np.inf)
+    return producao if producao.ndim else float(producao)
+
+# Elasticity regimes in the order interpret_elasticity tests them: (code, label, chart color)
+ELASTICITY_REGIMES = [
+    ("sem_dados", "Sem dados", "#95a5a6"),
+    ("muito_elastico", "Muito elástico", "#e74c3c"),
+    ("unitario", "Unitário", "#f39c12"),
+    ("inelastico", "Clientes fiéis", "#f39c12"),
+    ("demanda_garantida", "Demanda garantida", "#2ecc71"),
+    ("premium", "Premium", "#2ecc71"),
+]
+
+def classify_elasticity(values):
+    """
+    Classify many elasticity values at once with the thresholds of interpret_elasticity
+
+    Args:
+        values (array-like): Elasticity values (NaN/None for records without one)
+
+    Returns:
+        numpy.ndarray: Index into ELASTICITY_REGIMES for each value
+    """
+    epd = np.asarray(values, dtype=float)
+    conditions = [
+        np.isnan(epd),
+        epd < -1,
+        np.abs(epd + 1) < 0.1,
+        (epd > -1) & (epd < 0),
+        np.abs(epd) < 0.1,
+        epd > 0,
+    ]
+    return np.select(conditions, np.arange(len(conditions), dtype=np.int8), default=0).astype(np.int8)
+
+def elasticity_breakdown(values):
+    """
+    Count how many values fall in each elasticity regime
+
+    Args:
+        values (array-like): Elasticity values
+
+    Returns:
+        tuple: (codes, breakdown) where codes comes from classify_elasticity and
+        breakdown is a DataFrame with the count and share (%) of each regime
+    """
+    codes = classify_elasticity(values)
+    counts = np.bincount(codes, minlength=len(ELASTICITY_REGIMES))
+    total = counts.sum()
+    breakdown = pd.DataFrame({
+        'regime': [code for code, _, _ in ELASTICITY_REGIMES],
+        'descricao': [label for _, label, _ in ELASTICITY_REGIMES],
+        'quantidade': counts,
+        'participacao': counts / total * 100 if total else np.zeros(len(counts))
+    })
+    return codes, breakdown
+
+def elasticity_colors(values):
+    """Return the chart color of each value's elasticity regime"""
+    palette = np.array([color for _, _, color in ELASTICITY_REGIMES])
+    return palette[classify_elasticity(values)]
+
+# Recommendation tiers of a what-if projection, by profit change: (code, minimum change %)
+PROJECTION_TIERS = [
+    ("recomendado", 5),
+    ("testar", 0),
+    ("nao_recomendado", -np.inf),
+]
+
+def projetar_cenarios(preco_atual, quantidade_atual, custo_unitario, novos_precos, elasticidade):
+    """
+    Project daily sales, monthly revenue and monthly profit for one or many new prices
+
+    Args:
+        preco_atual (float): Current selling price
+        quantidade_atual (float): Current daily sales
+        custo_unitario (float): Cost per unit
+        novos_precos (array-like): Simulated selling price(s)
+        elasticidade (float): Price elasticity used for the projection
+
+    Returns:
+        pandas.DataFrame: One row per new price with the projected quantity, the
+        current/new revenue and profit, their changes (%) and the recommendation tier
+    """
+    novo_preco = np.atleast_1d(np.asarray(novos_precos, dtype=float))
+    variacao_quantidade = (novo_preco - preco_atual) / preco_atual * elasticidade
+    nova_quantidade = quantidade_atual * (1 + variacao_quantidade)
+
+    receita_atual = preco_atual * quantidade_atual * 30
+    receita_nova = novo_preco * nova_quantidade * 30
+    lucro_atual = (preco_atual - custo_unitario) * quantidade_atual * 30
+    lucro_novo = (novo_preco - custo_unitario) * nova_quantidade * 30
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variacao_receita = (receita_nova - receita_atual) / receita_atual * 100
+        variacao_lucro = (lucro_novo - lucro_atual) / lucro_atual * 100
+
+    conditions = [variacao_lucro > minimo for _, minimo in PROJECTION_TIERS[:-1]]
+    tiers = np.array([code for code, _ in PROJECTION_TIERS])
+    recomendacao = tiers[np.select(conditions, np.arange(len(conditions)), default=len(conditions))]
+
+    return pd.DataFrame({
+        'novo_preco': novo_preco,
+        'nova_quantidade': nova_quantidade,
+        'variacao_vendas': variacao_quantidade * 100,
+        'receita_atual': receita_atual,
+        'receita_nova': receita_nova,
+        'variacao_receita': variacao_receita,
+        'lucro_atual': lucro_atual,
+        'lucro_novo': lucro_novo,
+        'variacao_lucro': variacao_lucro,
+        'recomendacao': recomendacao
+    })
+
 def calcular_lucro_projetado(custo_unidade, preco_venda, quantidade_vendida):
     """
     Calculate projected profit
@@ -0,0 +1,248 @@
+"""
+Memory profiling for the dashboard
+
+With MEMORY_PROFILE=1 the dashboard takes tracemalloc snapshots at each
+section boundary and shows the top allocators of every section plus the
+memory still held since the previous rerun.
+
+`python profiling.py` drives the dashboard through many reruns in-process
+and exits with an error if resident memory or traced allocations grow by
+more than the given amount per rerun.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+MEMORY_PROFILE = os.environ.get("MEMORY_PROFILE") == "1"
+
+def _format_stat(stat):
+    """Describe one tracemalloc StatisticDiff as 'file:line (+KB)'"""
+    frame = stat.traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} ({stat.size_diff / 1024:+.1f} KB)"
+
+class SectionProfiler:
+    """
+    Attribute allocations of a script run to its sections
+
+    Call mark(name) when a section starts; allocations made between two
+    marks are attributed to the earlier section. The snapshot compared with
+    the next rerun is kept in `state`, e.g. the session's st.session_state,
+    so each session is only compared with its own previous rerun.
+    """
+
+    def __init__(self, enabled=MEMORY_PROFILE, top=5, state=None):
+        self.enabled = enabled
+        self.top = top
+        self.state = {} if state is None else state
+        self.sections = []
+        self._current = None
+        self._snapshot = None
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _close_section(self, snapshot):
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self.sections.append({
+            'secao': self._current,
+            'variacao_kb': sum(stat.size_diff for stat in stats) / 1024,
+            'maiores_alocacoes': ", ".join(_format_stat(stat) for stat in stats[:self.top])
+        })
+
+    def mark(self, name):
+        """Start a new section (no-op unless profiling is enabled)"""
+        if not self.enabled:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        if self._current is not None:
+            self._close_section(snapshot)
+        self._current, self._snapshot = name, snapshot
+
+    def report(self):
+        """
+        Close the last section and compare the end of this rerun with the previous one
+
+        Returns:
+            tuple: (DataFrame with one row per section, list of top retained allocators)
+        """
+        if not self.enabled:
+            return pd.DataFrame(), []
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+        if self._current is not None:
+            self._close_section(snapshot)
+            self._current = None
+
+        retained = []
+        previous = self.state.get('_memoria_snapshot')
+        if previous is not None:
+            retained = [_format_stat(stat) for stat in snapshot.compare_to(previous, 'lineno')[:self.top]]
+        self.state['_memoria_snapshot'] = snapshot
+        return pd.DataFrame(self.sections), retained
+
+def _current_rss_mb():
+    """Current resident memory of the process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        # Not Linux: fall back to the peak, which still catches steady growth
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _release_free_memory():
+    """Collect garbage and hand freed heap pages back to the OS so RSS tracks live memory"""
+    gc.collect()
+    try:
+        # glibc only: without the trim, RSS mostly reflects the allocator's free lists
+        ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+def _growth_per_rerun(samples):
+    """Median of the pairwise slopes (Theil-Sen), robust to one-off spikes and dips"""
+    valores = np.asarray(samples, dtype=float)
+    i, j = np.triu_indices(len(valores), 1)
+    return float(np.median((valores[j] - valores[i]) / (j - i)))
+
+def _seed_history(rows):
+    """Fill the database of the current directory with synthetic records"""
+    import database as db
+
+    rng = np.random.default_rng(0)
+    datas = pd.date_range(end=pd.Timestamp.now(), periods=rows, freq='h')
+    historico = pd.DataFrame({
+        'data_adicionada': datas.strftime('%Y-%m-%d %H:%M:%S'),
+        'precoInicio': rng.uniform(2.5, 3.5, rows).round(2),
+        'precoFinal': rng.uniform(4.0, 7.0, rows).round(2),
+        'quantidadeInicio': 100,
+        'quantidadeFinal': rng.integers(1500, 3000, rows)
+    })
+    db.import_data(StringIO(historico.to_csv(index=False)))
+
+def check_memory_growth(reruns=200, warmup=20, seed_rows=500, max_block_growth=35.0,
+                        max_rss_growth_mb=0.5, max_traced_growth_kb=10.0, traced_reruns=None, script=None):
+    """
+    Rerun the dashboard many times and fail if memory grows from rerun to rerun
+
+    The dashboard runs in this process against a temporary database seeded
+    with synthetic history. Live Python allocations (sys.getallocatedblocks)
+    and resident memory are sampled after every rerun without tracing
+    (tracemalloc's own bookkeeping would inflate RSS and slows reruns several
+    times), then traced Python allocations over `traced_reruns` more reruns.
+    Each series is reduced to a robust growth per rerun, so a leak of a few
+    dozen objects or KB per rerun fails long before it adds up to megabytes.
+
+    Args:
+        reruns (int): Number of untraced reruns sampled
+        warmup (int): Reruns before the first sample (caches, imports, fonts)
+        seed_rows (int): Synthetic records loaded before the runs
+        max_block_growth (float): Allowed growth of allocated Python blocks per rerun
+        max_rss_growth_mb (float, optional): Allowed resident memory growth per rerun.
+            RSS jumps between levels when the machine is busy, so short runs
+            need a loose limit; None only reports it.
+        max_traced_growth_kb (float): Allowed traced allocation growth per rerun
+        traced_reruns (int, optional): Reruns sampled with tracemalloc, `reruns`
+            by default; 0 skips them
+        script (str, optional): Dashboard script, front.py next to this file by default
+
+    Returns:
+        dict: Growth per rerun of each series and the first/last samples
+
+    Raises:
+        AssertionError: If any growth exceeds its threshold
+    """
+    from streamlit.testing.v1 import AppTest
+
+    if traced_reruns is None:
+        traced_reruns = reruns
+    script = os.path.abspath(script or os.path.join(os.path.dirname(__file__), "front.py"))
+    sys.path.insert(0, os.path.dirname(script))
+
+    def rerun(app):
+        app.run()
+        if app.exception:
+            raise RuntimeError(f"O painel falhou durante a verificação: {app.exception[0].message}")
+        _release_free_memory()
+
+    diretorio_original = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            _seed_history(seed_rows)
+            app = AppTest.from_file(script, default_timeout=120)
+            for _ in range(warmup):
+                rerun(app)
+
+            blocks, rss = [], []
+            for _ in range(reruns):
+                rerun(app)
+                blocks.append(sys.getallocatedblocks())
+                rss.append(_current_rss_mb())
+
+            traced = []
+            if traced_reruns:
+                tracing = tracemalloc.is_tracing()
+                if not tracing:
+                    tracemalloc.start()
+                # One traced rerun first so tracemalloc's first-time overhead isn't counted
+                rerun(app)
+                for _ in range(traced_reruns):
+                    rerun(app)
+                    traced.append(tracemalloc.get_traced_memory()[0] / 1024 ** 2)
+                if not tracing:
+                    tracemalloc.stop()
+        finally:
+            os.chdir(diretorio_original)
+
+    resultado = {}
+    if reruns > 1:
+        resultado.update(blocos_por_execucao=_growth_per_rerun(blocks),
+                         rss_inicial_mb=rss[0], rss_final_mb=rss[-1],
+                         rss_por_execucao_mb=_growth_per_rerun(rss))
+        assert resultado['blocos_por_execucao'] <= max_block_growth, (
+            f"Objetos Python vivos cresceram {resultado['blocos_por_execucao']:.0f} blocos por execução "
+            f"em {reruns} execuções (limite {max_block_growth:.0f})")
+        if max_rss_growth_mb is not None:
+            assert resultado['rss_por_execucao_mb'] <= max_rss_growth_mb, (
+                f"RSS cresceu {resultado['rss_por_execucao_mb'] * 1024:.0f} KB por execução em {reruns} "
+                f"execuções (limite {max_rss_growth_mb * 1024:.0f} KB)")
+    if traced_reruns > 1:
+        resultado.update(traced_inicial_mb=traced[0], traced_final_mb=traced[-1],
+                         traced_por_execucao_kb=_growth_per_rerun(traced) * 1024)
+        assert resultado['traced_por_execucao_kb'] <= max_traced_growth_kb, (
+            f"Alocações rastreadas cresceram {resultado['traced_por_execucao_kb']:.1f} KB por execução "
+            f"em {traced_reruns} execuções (limite {max_traced_growth_kb} KB)")
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica vazamento de memória em execuções repetidas do painel")
+    parser.add_argument("--reruns", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed-rows", type=int, default=500)
+    parser.add_argument("--max-block-growth", type=float, default=35.0,
+                        help="crescimento de blocos Python alocados permitido por execução")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=0.5,
+                        help="crescimento de RSS permitido por execução")
+    parser.add_argument("--max-traced-growth-kb", type=float, default=10.0,
+                        help="crescimento das alocações rastreadas permitido por execução")
+    parser.add_argument("--traced-reruns", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        resultado = check_memory_growth(args.reruns, args.warmup, args.seed_rows, args.max_block_growth,
+                                        args.max_rss_growth_mb, args.max_traced_growth_kb,
+                                        args.traced_reruns)
+    except AssertionError as exc:
+        print(f"❌ {exc}")
+        sys.exit(1)
+    print(f"✅ Sem crescimento relevante de memória: {resultado}")
@@ -0,0 +1,417 @@
+"""
+Local HTTP/JSON data service shared by several dashboard instances
+
+Run with `python service.py` and start the dashboards with
+DATA_SERVICE_URL=http://127.0.0.1:8765 so they read and write through the
+service instead of opening the CSV file themselves. The service keeps one
+warm copy of the history in memory and is the only process writing to it.
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+import database as db
+import sketches
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Tables travel as Arrow IPC streams: encoding and decoding them is far cheaper than CSV or JSON
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+def _frame_to_arrow(df, index=False):
+    """Serialize a DataFrame to an Arrow IPC stream (with its index when index=True)"""
+    table = pa.Table.from_pandas(df, preserve_index=index)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _frame_from_arrow(data):
+    """Read a DataFrame back from an Arrow IPC stream"""
+    return pa.ipc.open_stream(data).read_all().to_pandas()
+
+# Block size used to stream export files between the service and its clients
+EXPORT_BLOCK_SIZE = 1024 * 1024
+
+# Seconds between two runs of the retention job (records past db.RETENTION_DAYS are archived)
+RETENTION_INTERVAL = 24 * 60 * 60
+
+class _HistoryCache:
+    """
+    History kept in memory
+
+    The hot records are reloaded when the data files change (after every
+    write), while archived months are loaded on first use and kept until the
+    archive changes, so writes never make a read decompress the archive.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hot = None
+        self._hot_stamp = None
+        self._archive = {}
+        self._archive_stamp = None
+
+    def _files_stamp(self, *paths):
+        """Modification times of the given files"""
+        return tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in paths)
+
+    def invalidate(self):
+        """Drop the cached hot records so the next read reloads them"""
+        with self._lock:
+            self._hot = None
+
+    def _hot_data(self):
+        """Return the hot records, reading them only on a cache miss (call with the lock held)"""
+        stamp = self._files_stamp(db.DATA_FILE, db.PARTITION_MANIFEST)
+        if self._hot is None or stamp != self._hot_stamp:
+            self._hot = db.get_hot_data()
+            self._hot_stamp = stamp
+        return self._hot
+
+    def get(self, days=None):
+        """Return the records of the period, opening only the archived months it reaches"""
+        cutoff_date = None if days is None else datetime.now() - pd.Timedelta(days=days)
+        with self._lock:
+            stamp = self._files_stamp(db.ARCHIVE_MANIFEST)
+            if stamp != self._archive_stamp:
+                self._archive = {}
+                self._archive_stamp = stamp
+
+            frames = []
+            for mes in db.archived_months(cutoff_date):
+                if mes not in self._archive:
+                    self._archive[mes] = db.get_archived_month(mes)
+                frames.append(self._archive[mes])
+            frames.append(self._hot_data())
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if cutoff_date is not None:
+            df = df[df['data_adicionada'] >= cutoff_date]
+        return df
+
+    def latest(self):
+        """Return the latest record as a tuple like database.get_latest_data"""
+        # Archiving always leaves the latest record in the hot data
+        with self._lock:
+            df = self._hot_data()
+        if df.empty:
+            return None
+        latest_row = df.loc[db.latest_index(df)]
+        return tuple(
+            latest_row[col].item() if hasattr(latest_row[col], 'item') else latest_row[col]
+            for col in ('precoInicio', 'precoFinal', 'quantidadeInicio', 'quantidadeFinal', 'elasticidade')
+        )
+
+_cache = _HistoryCache()
+
+class _DataRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps client connections open between requests
+    protocol_version = "HTTP/1.1"
+    # Send small responses right away instead of waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(json.dumps(payload).encode('utf-8'), "application/json", status)
+
+    def _send_export(self, formato, days):
+        """Export the period to a temporary file and stream it back in blocks"""
+        fd, path = tempfile.mkstemp(suffix=f".{formato}")
+        os.close(fd)
+        try:
+            rows = db.export_filtered_data(path, formato, days)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("X-Registros", str(rows))
+            self.end_headers()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile, EXPORT_BLOCK_SIZE)
+        finally:
+            os.remove(path)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        try:
+            days = int(params["days"][0]) if "days" in params else None
+            if url.path == "/latest":
+                self._send_json({"latest": _cache.latest()})
+            elif url.path == "/filtered":
+                self._send(_frame_to_arrow(_cache.get(days)), ARROW_MIME)
+            elif url.path == "/aggregate":
+                result = db.aggregate_data(
+                    params["group_by"][0], json.loads(params["metrics"][0]), days,
+                    price_band=float(params.get("price_band", [0.5])[0]),
+                    price_column=params.get("price_column", ["precoFinal"])[0]
+                )
+                self._send(_frame_to_arrow(result, index=True), ARROW_MIME)
+            elif url.path == "/stamp":
+                self._send_json({"stamp": db.data_stamp()})
+            elif url.path == "/distribution":
+                sketch = db.get_distribution(params["column"][0], days)
+                self._send_json({"counts": None if sketch is None else sketch.to_sparse()})
+            elif url.path == "/export":
+                self._send_export(params.get("formato", ["csv"])[0], days)
+            else:
+                self._send_json({"error": f"Rota desconhecida: {url.path}"}, status=404)
+        except Exception as exc:
+            self._send_json({"error": str(exc)}, status=500)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            payload = self._read_json()
+            if url.path == "/insert":
+                new_id = db.insert_data(**payload)
+                _cache.invalidate()
+                self._send_json({"id": int(new_id)})
+            elif url.path == "/elasticity":
+                updated = db.update_elasticity(payload["elasticidade"])
+                _cache.invalidate()
+                self._send_json({"updated": bool(updated)})
+            else:
+                self._send_json({"error": f"Rota desconhecida: {url.path}"}, status=404)
+        except Exception as exc:
+            self._send_json({"error": str(exc)}, status=500)
+
+def _run_retention(interval=RETENTION_INTERVAL):
+    """Archive records past the retention window now and then once per interval"""
+    while True:
+        try:
+            if db.archive_old_data(db.RETENTION_DAYS):
+                _cache.invalidate()
+        except Exception as exc:
+            print(f"⚠️ Erro ao arquivar registros antigos: {exc}")
+        time.sleep(interval)
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Create the data service (call serve_forever() on the result to run it)
+
+    Writes go through the background group-commit writer, so the service is
+    the single writer of the data files. It also runs the retention job that
+    the dashboards run themselves when they access the files directly.
+    """
+    db.create_database()
+    db.migrate_database()
+    db.start_background_writer()
+    threading.Thread(target=_run_retention, name="retention", daemon=True).start()
+    if not db.has_sketches():
+        # Histories stored before the sketches existed get them built off the request path
+        threading.Thread(target=db.rebuild_sketches, name="sketch-rebuild", daemon=True).start()
+    return ThreadingHTTPServer((host, port), _DataRequestHandler)
+
+class ServiceClient:
+    """
+    Client for the data service with the same API as the database module
+
+    Connections are kept alive and reused from a small pool, so each call
+    costs one round trip on an open socket.
+    """
+
+    def __init__(self, base_url, pool_size=4, timeout=10):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method, path, payload=None):
+        """Send a request and return the raw response body"""
+        body = None if payload is None else json.dumps(payload)
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        # Retry reads once on a fresh connection if the pooled one was closed by the
+        # server. Writes aren't retried: the server may have applied them already
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                if attempt or method != "GET":
+                    raise
+                continue
+            self._release(conn)
+            if response.status != 200:
+                raise RuntimeError(json.loads(data).get("error", f"HTTP {response.status}"))
+            return data
+
+    def _request(self, method, path, payload=None):
+        """Send a request and return its decoded JSON response"""
+        return json.loads(self._send(method, path, payload))
+
+    def insert_data(self, data_adicionada, precoInicio, precoFinal, quantidadeInicio, quantidadeFinal, elasticidade=None):
+        """Insert new data through the service and return its ID"""
+        return self._request("POST", "/insert", {
+            "data_adicionada": data_adicionada,
+            "precoInicio": precoInicio,
+            "precoFinal": precoFinal,
+            "quantidadeInicio": quantidadeInicio,
+            "quantidadeFinal": quantidadeFinal,
+            "elasticidade": elasticidade
+        })["id"]
+
+    def get_latest_data(self):
+        """Fetch the latest data record"""
+        latest = self._request("GET", "/latest")["latest"]
+        return tuple(latest) if latest is not None else None
+
+    def update_elasticity(self, elasticidade):
+        """Update the elasticity value for the latest record"""
+        return self._request("POST", "/elasticity", {"elasticidade": elasticidade})["updated"]
+
+    def get_filtered_data(self, days=None):
+        """Get data filtered by a specific time period"""
+        path = "/filtered" if days is None else f"/filtered?days={int(days)}"
+        return _frame_from_arrow(self._send("GET", path))
+
+    def aggregate_data(self, group_by, metrics, days=None, price_band=0.5, price_column='precoFinal'):
+        """Aggregate records by time bucket or price band on the service"""
+        query = {"group_by": group_by, "metrics": json.dumps(metrics),
+                 "price_band": price_band, "price_column": price_column}
+        if days is not None:
+            query["days"] = int(days)
+        return _frame_from_arrow(self._send("GET", f"/aggregate?{urlencode(query)}"))
+
+    def data_stamp(self):
+        """Return the service's data stamp (see database.data_stamp)"""
+        return tuple(tuple(item) for item in self._request("GET", "/stamp")["stamp"])
+
+    def get_distribution(self, column, days=None):
+        """Get the distribution of a column from the service's sketches (None while they are being built)"""
+        query = {"column": column}
+        if days is not None:
+            query["days"] = int(days)
+        counts = self._request("GET", f"/distribution?{urlencode(query)}")["counts"]
+        if counts is None:
+            return None
+        return sketches.BinnedSketch.from_sparse(db.SKETCH_EDGES[column], counts)
+
+    def export_filtered_data(self, destination, formato='csv', days=None):
+        """
+        Export the data for a time period through the service
+
+        The file is built by the service and copied to `destination` (a path
+        or binary buffer) in blocks, so memory stays bounded here too.
+
+        Returns:
+            int: Number of rows exported
+        """
+        query = {"formato": formato}
+        if days is not None:
+            query["days"] = int(days)
+        conn = self._connection()
+        try:
+            conn.request("GET", f"/export?{urlencode(query)}")
+            response = conn.getresponse()
+            if response.status != 200:
+                raise RuntimeError(json.loads(response.read()).get("error", f"HTTP {response.status}"))
+            if isinstance(destination, (str, os.PathLike)):
+                with open(destination, 'wb') as out:
+                    shutil.copyfileobj(response, out, EXPORT_BLOCK_SIZE)
+            else:
+                shutil.copyfileobj(response, destination, EXPORT_BLOCK_SIZE)
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        return int(response.getheader("X-Registros"))
+
+    def close(self):
+        """Close every pooled connection"""
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+def benchmark_reads(client, days=None, repeats=50):
+    """
+    Compare read latency of the service against reading the CSV directly
+
+    Args:
+        client (ServiceClient): Client connected to a running service
+        days (int, optional): Period passed to get_filtered_data
+        repeats (int): Number of timed calls per path
+
+    Returns:
+        dict: Median and p95 latency in milliseconds for 'direct' and 'service'
+    """
+    def measure(fn):
+        fn()  # Warm up the cache / connection
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {"median_ms": timings[len(timings) // 2], "p95_ms": timings[int(len(timings) * 0.95) - 1]}
+
+    return {
+        "direct": measure(lambda: db.get_filtered_data(days)),
+        "service": measure(lambda: client.get_filtered_data(days))
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço de dados compartilhado para os painéis")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compara a latência de leitura com o acesso direto ao arquivo e sai")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port)
+    if args.benchmark:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = ServiceClient(f"http://{args.host}:{args.port}")
+        for days in (7, 30, 120, None):
+            print(days, benchmark_reads(client, days))
+        server.shutdown()
+    else:
+        print(f"✅ Serviço de dados em http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        finally:
+            db.stop_background_writer()
@@ -0,0 +1,109 @@
+"""
+Mergeable fixed-bin sketches for distributions and quantiles
+
+A sketch keeps one counter per bin of a fixed set of edges (plus underflow
+and overflow counters), so it has a constant size whatever the number of
+values, two sketches with the same edges merge by adding their counters,
+and values can be removed again by adding them with a negative weight.
+"""
+import numpy as np
+
+# Elasticity: linear bins of width 0.01 between -5 and 5 (quantiles within ±0.005)
+ELASTICITY_EDGES = np.round(np.linspace(-5, 5, 1001), 2)
+
+# Prices: geometric bins growing 1% each from R$ 0.01 to R$ 10,000 (quantiles within ~0.5%)
+PRICE_EDGES = np.geomspace(0.01, 10_000, int(np.ceil(np.log(1e6) / np.log(1.01))) + 1)
+
+class BinnedSketch:
+    """
+    Histogram of values over fixed bin edges
+
+    counts[0] holds values below edges[0], counts[-1] values at or above
+    edges[-1] and counts[i] values in [edges[i-1], edges[i]).
+    """
+
+    def __init__(self, edges, counts=None):
+        self.edges = edges
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64) if counts is None else counts
+
+    @classmethod
+    def from_sparse(cls, edges, sparse):
+        """Build a sketch from a {bin index: count} mapping"""
+        sketch = cls(edges)
+        sketch.add_sparse(sparse)
+        return sketch
+
+    def bin_index(self, values):
+        """Return the counter index of each value"""
+        return np.searchsorted(self.edges, np.asarray(values, dtype=float), side='right')
+
+    def add(self, values, weight=1):
+        """Count values (NaN is ignored); use weight=-1 to remove them"""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        np.add.at(self.counts, self.bin_index(values), weight)
+        return self
+
+    def add_sparse(self, sparse):
+        """Add a {bin index: count} mapping, e.g. one time bucket of a stored sketch"""
+        if sparse:
+            idx = np.fromiter((int(i) for i in sparse), dtype=np.int64, count=len(sparse))
+            self.counts[idx] += np.fromiter(sparse.values(), dtype=np.int64, count=len(sparse))
+        return self
+
+    def merge(self, other):
+        """Return a new sketch counting the values of both"""
+        return BinnedSketch(self.edges, self.counts + other.counts)
+
+    def to_sparse(self):
+        """Return the non-zero counters as a {bin index: count} mapping"""
+        idx = np.flatnonzero(self.counts)
+        return {str(i): int(self.counts[i]) for i in idx}
+
+    @property
+    def count(self):
+        """Number of values in the sketch"""
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        """
+        Approximate quantile(s), interpolating linearly inside the bin
+
+        Args:
+            q (float or array): Quantile(s) between 0 and 1
+
+        Returns:
+            float or numpy.ndarray: NaN when the sketch is empty
+        """
+        q = np.asarray(q, dtype=float)
+        total = self.counts.sum()
+        if total <= 0:
+            return np.full(q.shape, np.nan) if q.ndim else float('nan')
+
+        cumulative = np.cumsum(self.counts)
+        # A tiny positive target makes q=0 land on the first non-empty bin
+        target = np.maximum(q * total, 1e-9)
+        i = np.clip(np.searchsorted(cumulative, target, side='left'), 0, len(self.counts) - 1)
+
+        # Under/overflow bins have no width, answer with the nearest edge
+        lower = self.edges[np.clip(i - 1, 0, len(self.edges) - 1)]
+        upper = self.edges[np.clip(i, 0, len(self.edges) - 1)]
+        before = np.where(i > 0, cumulative[i - 1], 0)
+        in_bin = self.counts[i]
+        fraction = np.where(in_bin > 0, (target - before) / np.maximum(in_bin, 1), 0)
+        result = lower + np.clip(fraction, 0, 1) * (upper - lower)
+        return result if result.ndim else float(result)
+
+    def histogram(self, bins):
+        """
+        Re-bin the sketch into coarser bins for display
+
+        Args:
+            bins (array): Bin edges, like numpy.histogram
+
+        Returns:
+            numpy.ndarray: Count per bin (values outside the edges are left out)
+        """
+        centers = 0.5 * (self.edges[:-1] + self.edges[1:])
+        counts, _ = np.histogram(centers, bins=bins, weights=self.counts[1:-1])
+        return counts.astype(np.int64)
@@ -0,0 +1,33 @@
+import logging
+import tracemalloc
+
+import profiling
+
+
+def test_reruns_do_not_grow_memory():
+    # Growth per rerun over 15 reruns: a few dozen leaked objects per rerun fail.
+    # RSS only gets a loose limit here and the slow traced phase is left to the
+    # soak in `python profiling.py`.
+    # pytest keeps every log record of a test, which would read as a leak
+    logging.disable(logging.CRITICAL)
+    try:
+        resultado = profiling.check_memory_growth(reruns=15, warmup=4, seed_rows=20,
+                                                  max_rss_growth_mb=2.0, traced_reruns=0)
+    finally:
+        logging.disable(logging.NOTSET)
+    assert 'blocos_por_execucao' in resultado
+
+
+def test_retained_report_is_per_session():
+    tracing = tracemalloc.is_tracing()
+    try:
+        sessao_a, sessao_b = {}, {}
+        profiling.SectionProfiler(enabled=True, state=sessao_a).report()
+
+        # The first rerun of another session has nothing of its own to compare with
+        _, retidos = profiling.SectionProfiler(enabled=True, state=sessao_b).report()
+        assert retidos == []
+        assert sessao_a['_memoria_snapshot'] is not sessao_b['_memoria_snapshot']
+    finally:
+        if not tracing:
+            tracemalloc.stop()